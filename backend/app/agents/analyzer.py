@@ -1,11 +1,105 @@
 from langchain_core.messages import SystemMessage, HumanMessage
 from app.agents.state import AgentState
 from app.models import NewsAnalysis
+from pydantic import ValidationError
 from app.utils.scraper import scrape_url
 from app.agents.monitoring import search_brand_mentions
-from app.llm_factory import get_llm
+from app.llm_router import get_routed_llm, should_hedge, AllProvidersFailed, ANALYZER_CHEAP_PROVIDER
+from app.analysis_cache import make_cache_key, get_cached_analysis, cache_analysis
+from app.utils.condenser import condense_text
+from app.utils.json_repair import parse_json_tolerant
 import json
 import random
+import re
+
+SENTIMENTS = {"POSITIVE", "NEGATIVE", "NEUTRAL"}
+CATEGORIES = {"CRISIS", "PRODUCT", "COMPETITOR", "ROUTINE"}
+LIST_FIELDS = [name for name, field in NewsAnalysis.model_fields.items() if getattr(field.annotation, "__origin__", None) is list]
+
+def response_data(response) -> dict:
+    """
+    The analysis as a dict: native structured output if the provider produced it,
+    otherwise whatever the tolerant parser recovers from the text (raises if nothing).
+    """
+    if isinstance(response, dict):  # with_structured_output(..., include_raw=True)
+        parsed = response.get("parsed")
+        if isinstance(parsed, NewsAnalysis):
+            return parsed.model_dump()
+        raw = response.get("raw")
+        for call in getattr(raw, "tool_calls", None) or []:
+            if isinstance(call.get("args"), dict):
+                return call["args"]
+        response = raw
+    return parse_json_tolerant(response.content if isinstance(response.content, str) else str(response.content))
+
+def coerce_analysis(data: dict) -> dict:
+    """Local fixes for common near-misses (case, strings instead of lists, "85/100")."""
+    data = dict(data)
+    for name in LIST_FIELDS:
+        if isinstance(data.get(name), str):
+            data[name] = [data[name]] if data[name].strip() else []
+    sentiment = str(data.get("sentiment", "")).strip().upper()
+    if sentiment in SENTIMENTS:
+        data["sentiment"] = sentiment
+    category = str(data.get("category", "")).strip().upper()
+    if category in CATEGORIES:
+        data["category"] = category
+    score = data.get("relevance_score")
+    if isinstance(score, str):
+        match = re.search(r"\d+", score)
+        if match:
+            data["relevance_score"] = int(match.group(0))
+    if isinstance(data.get("relevance_score"), (int, float)):
+        data["relevance_score"] = max(0, min(100, int(data["relevance_score"])))
+    return data
+
+def invalid_fields(data: dict) -> dict:
+    """field -> problem, for fields that are missing or fail NewsAnalysis validation."""
+    try:
+        NewsAnalysis(**data)
+        return {}
+    except ValidationError as e:
+        return {str(error["loc"][0]): error["msg"] for error in e.errors() if error.get("loc")}
+
+async def repair_analysis(data: dict, problems: dict, news_text: str, model_provider: str) -> NewsAnalysis:
+    """Re-requests only the missing/invalid fields (from the cheap model if one is configured) and merges them."""
+    schema = NewsAnalysis.model_json_schema()["properties"]
+    fields = {name: schema[name] for name in problems if name in schema}
+    valid = {name: value for name, value in data.items() if name in schema and name not in problems}
+    prompt = f"""
+    A JSON analysis of the news below is incomplete. Provide ONLY the listed fields as a JSON object.
+    All text in RUSSIAN. sentiment: POSITIVE|NEGATIVE|NEUTRAL. category: CRISIS|PRODUCT|COMPETITOR|ROUTINE. relevance_score: 0-100.
+    
+    Fields to provide (schema) and what was wrong:
+    {json.dumps({name: {"schema": fields[name], "problem": problems[name]} for name in fields}, ensure_ascii=False)}
+    
+    Already known (keep consistent with it):
+    {json.dumps(valid, ensure_ascii=False)}
+    
+    News Text:
+    {news_text}
+    """
+    llm = get_routed_llm(ANALYZER_CHEAP_PROVIDER or model_provider, temperature=0)
+    response = await llm.ainvoke([
+        SystemMessage(content="You fix JSON. Output ONLY JSON."),
+        HumanMessage(content=prompt)
+    ])
+    patch = parse_json_tolerant(response.content)
+    return NewsAnalysis(**coerce_analysis({**valid, **{name: patch[name] for name in fields if name in patch}}))
+
+def analysis_validator(news_text: str, model_provider: str):
+    """
+    validate() for the router: structured output or tolerant parse, local coercion, then one
+    field-level repair call. Raises (and the router moves on) only if the repair fails too.
+    """
+    async def validate(response) -> NewsAnalysis:
+        data = coerce_analysis(response_data(response))
+        problems = invalid_fields(data)
+        if not problems:
+            return NewsAnalysis(**data)
+        print(f"Analysis repair for fields: {sorted(problems)}")
+        return await repair_analysis(data, problems, news_text, model_provider)
+    return validate
 
 async def analyzer_node(state: AgentState) -> AgentState:
     """Analyzes the news content."""
@@ -14,10 +108,14 @@ async def analyzer_node(state: AgentState) -> AgentState:
     model_provider = state['input'].model_provider if state.get('input') else "claude"
     print(f"Using Model: {model_provider}")
     
-    try:
-        llm = get_llm(model_provider)
-    except ValueError as e:
-        return {"errors": [str(e)]}
+    # Cheap model first (if configured), escalating along the cascade when its JSON doesn't validate
+    # (the news category isn't known yet, so hedging here is decided by mode only)
+    llm = get_routed_llm(
+        model_provider,
+        cheap_first=ANALYZER_CHEAP_PROVIDER or None,
+        hedge=should_hedge("analyzer", state.get("mode", "pr")),
+        structured=NewsAnalysis
+    )
 
     news_input = state['input']
     news_text = news_input.text
@@ -65,6 +163,15 @@ async def analyzer_node(state: AgentState) -> AgentState:
     mode = state.get('mode', 'pr')
     target_brand = state.get('target_brand')
     
+    # 2. Cache lookup (same article + brand + mode + model -> same analysis)
+    cache_key = None
+    if getattr(news_input, "use_cache", True):
+        cache_key = make_cache_key(news_text, brand_profile, mode, target_brand, model_provider)
+        cached = await get_cached_analysis(cache_key)
+        if cached:
+            print("Analysis cache hit")
+            return {"analysis": cached}
+    
     brand_context = ""
     role_context = ""
     
@@ -111,7 +218,8 @@ async def analyzer_node(state: AgentState) -> AgentState:
         else:
             role_context = "YOUR ROLE: You are a PR Strategist."
 
-    # 3. Analyze
+    # 3. Analyze (long articles are condensed chunk by chunk to the token budget, not truncated)
+    analysis_text = await condense_text(news_text)
     prompt = f"""
     {role_context}
     
@@ -120,7 +228,7 @@ async def analyzer_node(state: AgentState) -> AgentState:
     {brand_context}
     
     News Text:
-    {news_text[:10000]}
+    {analysis_text}
     
     Task:
     1. Extract key facts, quotes, and summary.
@@ -164,36 +272,15 @@ async def analyzer_node(state: AgentState) -> AgentState:
     ]
     
     try:
-        response = await llm.ainvoke(messages)
-    except Exception as e:
-        return {"errors": [f"LLM Invoke Error: {str(e)}"]}
+        analysis, provider = await llm.ainvoke_validated(
+            messages, validate=analysis_validator(analysis_text, model_provider)
+        )
+    except AllProvidersFailed as e:
+        print(f"Error analyzing: {e}")
+        return {"errors": [f"LLM Invoke Error: {str(e)}"], "retryable": True}
+    print(f"Analysis by {provider}")
     
-    try:
-        # Robust parsing using regex to find the first JSON object
-        content = response.content.strip()
-        
-        # 1. Try to extract from code blocks first
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0]
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0]
-            
-        # 2. Cleanup and Load
-        import re
-        content = content.strip()
-        
-        # If still contains non-json text, try regex for {...}
-        if not content.startswith("{"):
-            match = re.search(r'\{.*\}', content, re.DOTALL)
-            if match:
-                content = match.group(0)
-        
-        analysis_dict = json.loads(content)
-        analysis = NewsAnalysis(**analysis_dict)
-        
-        return {"analysis": analysis}
-    except Exception as e:
-        print(f"Error parsing analysis: {e}")
-        # Log bad content for debugging
-        print(f"Content: {response.content[:500]}...") 
-        return {"errors": [f"JSON Parse Error: {str(e)}"]}
+    if cache_key:
+        await cache_analysis(cache_key, analysis)
+    
+    return {"analysis": analysis}
@@ -4,14 +4,19 @@ from app.agents.analyzer import analyzer_node
 from app.agents.writer import writer_node
 from app.rag.store import rag_store
 
-def context_node(state: AgentState) -> AgentState:
+async def context_node(state: AgentState) -> AgentState:
     """Retrieves context from RAG for the current user."""
     # Запрос в RAG на основе саммари
     analysis = state.get('analysis')
     user_id = state.get('user_id')
     query = analysis.summary if analysis else (state['input'].text[:200] if state['input'].text else "News")
     
-    context = rag_store.query(query, user_id=user_id)
+    try:
+        context = await rag_store.aquery(query, user_id=user_id)
+    except Exception as e:
+        # RAG is an enhancement: a slow or unavailable vector store shouldn't fail the plan
+        print(f"RAG Query Error: {e}")
+        context = []
     return {"context": context}
 
 from app.agents.visual import visual_node
@@ -1,21 +1,141 @@
 from tavily import TavilyClient
+import asyncio
+import hashlib
+import json
 import os
+import time
 from app.models import BrandProfile, NewsInput
-from typing import List
+from app.redis_client import redis_client
+from typing import List, Dict
+
+# "tavily" (default) or "stub" (deterministic results, no network - for tests and local runs)
+SEARCH_PROVIDER = os.getenv("SEARCH_PROVIDER", "tavily")
+
+# Search results are reused within a time bucket: repeated scans don't spend quota
+SEARCH_CACHE_BUCKET = int(os.getenv("SEARCH_CACHE_BUCKET", "900"))  # seconds
+SEARCH_CACHE_STATS_KEY = "search_cache:stats"  # HASH: hits / misses
+
+_tavily_client = None
 
 def get_tavily():
+    """Shared Tavily client (None if no API key is configured)."""
+    global _tavily_client
     api_key = os.getenv("TAVILY_API_KEY")
     if not api_key:
         # Mock for development if key is missing
         return None
-    return TavilyClient(api_key=api_key)
+    if _tavily_client is None:
+        _tavily_client = TavilyClient(api_key=api_key)
+    return _tavily_client
+
+class TavilySearchProvider:
+    """Tavily news search. The SDK is synchronous, so calls run in a thread."""
+
+    cacheable = True
+
+    async def search(self, query: str) -> List[Dict]:
+        response = await asyncio.to_thread(
+            get_tavily().search,
+            query=query,
+            search_depth="advanced",
+            topic="news",
+            days=1
+        )
+        return [{"url": result["url"], "content": result["content"]} for result in response.get("results", [])]
+
+class StubSearchProvider:
+    """
+    Offline search provider. Returns `results` if set, otherwise a few stable
+    mentions per query, so repeated scans see the same URLs.
+    """
+
+    cacheable = False  # tests change `results` between scans
+
+    def __init__(self, results: List[Dict] | None = None, per_query: int = 3):
+        self.results = results
+        self.per_query = per_query
+        self.calls: List[str] = []
+
+    async def search(self, query: str) -> List[Dict]:
+        self.calls.append(query)
+        if self.results is not None:
+            return list(self.results)
+        slug = hashlib.sha1(query.encode("utf-8")).hexdigest()[:8]
+        return [
+            {"url": f"https://news.example.com/{slug}/{i}", "content": f"Stub mention #{i} for query: {query}"}
+            for i in range(self.per_query)
+        ]
+
+_stub_provider = StubSearchProvider()
+_tavily_provider = TavilySearchProvider()
+
+def get_search_provider():
+    """Search provider used by search_brand_mentions (None = no Tavily key, use the mock)."""
+    if SEARCH_PROVIDER == "stub":
+        return _stub_provider
+    if get_tavily() is None:
+        return None
+    return _tavily_provider
+
+def build_query(brand: BrandProfile) -> str:
+    return f"{brand.name} {' OR '.join(brand.keywords)}"
+
+def get_search_cache_key(query: str, bucket: int) -> str:
+    digest = hashlib.sha256(f"{SEARCH_PROVIDER}|{query}".encode("utf-8")).hexdigest()
+    return f"search_cache:{digest}:{bucket}"
+
+# Searches in flight in this process: concurrent scans of one brand share a single call
+_inflight: Dict[str, asyncio.Future] = {}
+
+async def cached_search(provider, query: str) -> List[Dict]:
+    """Provider search cached per (query, time bucket). Failed searches are not cached."""
+    if not getattr(provider, "cacheable", True):
+        return await provider.search(query)
+
+    key = get_search_cache_key(query, int(time.time() // SEARCH_CACHE_BUCKET))
+    try:
+        cached = await redis_client.get(key)
+        await redis_client.hincrby(SEARCH_CACHE_STATS_KEY, "hits" if cached else "misses", 1)
+        if cached:
+            return json.loads(cached)
+    except Exception as e:
+        print(f"Search Cache Read Error: {e}")
+
+    future = _inflight.get(key)
+    if future is not None:
+        return await asyncio.shield(future)
+    future = asyncio.ensure_future(provider.search(query))
+    _inflight[key] = future
+    try:
+        results = await asyncio.shield(future)
+    finally:
+        _inflight.pop(key, None)
+
+    try:
+        await redis_client.setex(key, SEARCH_CACHE_BUCKET, json.dumps(results, ensure_ascii=False))
+    except Exception as e:
+        print(f"Search Cache Write Error: {e}")
+    return results
+
+async def get_search_cache_stats() -> dict:
+    try:
+        stats = await redis_client.hgetall(SEARCH_CACHE_STATS_KEY)
+    except Exception as e:
+        print(f"Search Cache Stats Error: {e}")
+        return {}
+    hits = int(stats.get("hits", 0))
+    misses = int(stats.get("misses", 0))
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "hit_rate": round(hits / total, 4) if total else 0.0}
 
 async def search_brand_mentions(brand: BrandProfile) -> List[NewsInput]:
     """
-    Searches for recent news about the brand using Tavily.
+    Searches for recent news about the brand using Tavily (or the stub provider).
     """
-    client = get_tavily()
-    if not client:
+    query = build_query(brand)
+
+    provider = get_search_provider()
+    if provider is None:
         # Mock response
         return [
             NewsInput(
@@ -24,27 +144,18 @@ async def search_brand_mentions(brand: BrandProfile) -> List[NewsInput]:
                 brand_profile=brand
             )
         ]
-        
-    query = f"{brand.name} {' OR '.join(brand.keywords)}"
     
     try:
-        response = client.search(
-            query=query,
-            search_depth="advanced",
-            topic="news",
-            days=1
-        )
-        
-        results = []
-        for result in response.get("results", []):
-            results.append(NewsInput(
-                url=result["url"],
-                text=result["content"], # Tavily returns a snippet/content
-                brand_profile=brand
-            ))
-            
-        return results
-        
+        results = await cached_search(provider, query)
     except Exception as e:
         print(f"Tavily Search Error: {e}")
         return []
+    
+    return [
+        NewsInput(
+            url=result["url"],
+            text=result["content"], # Tavily returns a snippet/content
+            brand_profile=brand
+        )
+        for result in results
+    ]
@@ -2,6 +2,7 @@ from typing import TypedDict, Annotated, List, Dict, Literal
 from app.models import NewsInput, NewsAnalysis, GeneratedPost
 
 class AgentState(TypedDict):
+    task_id: str | None  # For progress events
     input: NewsInput
     user_id: int  # Current user ID for data isolation
     mode: Literal["blogger", "pr"]  # Blogger or PR mode
@@ -10,3 +11,4 @@ class AgentState(TypedDict):
     context: List[str] # Retrieved from RAG
     posts: List[GeneratedPost]
     errors: List[str]
+    retryable: bool  # errors came from LLM providers / transport, a later attempt may succeed
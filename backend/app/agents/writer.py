@@ -1,10 +1,219 @@
 from langchain_core.messages import SystemMessage, HumanMessage
 from app.agents.state import AgentState
 from app.models import GeneratedPost, Platform
-from app.llm_factory import get_llm
+from app.llm_router import get_routed_llm, should_hedge
+from app.utils.json_repair import parse_json_tolerant
+from app.progress import publish_progress
+import asyncio
 import os
+import re
 
-def writer_node(state: AgentState) -> AgentState:
+# Define platforms and their specific strategies
+PLATFORMS = [
+    Platform.TELEGRAM, 
+    Platform.VK, 
+    Platform.TENCHAT,
+    Platform.VC,
+    Platform.DZEN,
+    Platform.EMAIL,
+    Platform.PRESS_RELEASE
+]
+
+# Max simultaneous LLM calls per plan (1 = old sequential behaviour)
+WRITER_CONCURRENCY = int(os.getenv("WRITER_CONCURRENCY", str(len(PLATFORMS))))
+
+# "parallel" = one call per platform, "single" = all platforms in one JSON response
+WRITER_MODE = os.getenv("WRITER_MODE", "parallel")
+
+DEFAULT_IMAGE_PROMPT = "Abstract modern technology, 4k, digital art"
+
+def get_style_guide(platform: Platform) -> str:
+    """Returns platform-specific formatting constraints."""
+    if platform == Platform.EMAIL:
+        return """
+                ФОРМАТ СЛУЖЕБНОЙ ЗАПИСКИ.
+                Структура:
+                Тема: [Четкая, побуждающая к действию тема]
+                Кому: [Целевые стейкхолдеры]
+                Рекомендация: [Конкретный совет]
+                
+                Текст:
+                [Краткий анализ ситуации и обоснование позиции. Официально, но прямо.]
+                """
+    elif platform == Platform.PRESS_RELEASE:
+        return """
+                ФОРМАТ ОФИЦИАЛЬНОГО ПРЕСС-РЕЛИЗА.
+                Структура:
+                ДЛЯ НЕМЕДЛЕННОГО РАСПРОСТРАНЕНИЯ
+                
+                [ЗАГОЛОВОК]
+                
+                [Город, Дата] — [Лид-абзац]
+                
+                [Основной текст]
+                
+                [О компании]
+                
+                Контакты для СМИ:
+                [Имя/Email]
+                """
+    elif platform == Platform.TELEGRAM:
+        return "Telegram Channel Style. Use Markdown (*bold*) and Emojis 🚀. Short paragraphs."
+    else:
+        return "Engaging social media style. Emojis allowed. NO Markdown headers. Ready to publish."
+
+def build_platform_prompt(platform: Platform, voice_instruction: str, analysis, context_str: str) -> str:
+    """Builds the user prompt for a single platform."""
+    style_guide = get_style_guide(platform)
+    return f"""
+            {voice_instruction}
+            
+            CRITICAL RULES:
+            1. **Perspective**: {voice_instruction}
+            2. **Language**: The post MUST be in RUSSIAN (except for the Image Prompt).
+            3. **Structure**: Follow the Style Guide for {platform.value} strictly.
+            4. **Grounding**: Base content on facts.
+            
+            Analysis:
+            - Summary: {analysis.summary}
+            - Facts: {", ".join(analysis.facts)}
+            - Sentiment: {analysis.sentiment}
+            - PR Verdict: {analysis.pr_verdict} ({analysis.pr_reasoning})
+            
+            Brand Context:
+            {context_str}
+            
+            Style Guide: {style_guide}
+            
+            REQUIRED OUTPUT FORMAT:
+            1. Output ONLY the final post text.
+            2. For Email/Press Release, include the headers (Subject, Title) as part of the text.
+            3. Do NOT include "Image Prompt:" label.
+            
+            At the very end, strictly separated by "|||", provide the Image Prompt in English.
+            """
+
+def parse_post(platform: Platform, full_content: str) -> GeneratedPost:
+    """Splits raw LLM output into post text and image prompt."""
+    content = full_content
+    image_prompt = DEFAULT_IMAGE_PROMPT
+    
+    if "|||" in full_content:
+        parts = full_content.split("|||")
+        content = parts[0].strip()
+        if len(parts) > 1:
+            image_prompt = parts[1].strip()
+    
+    return GeneratedPost(
+        platform=platform,
+        content=content,
+        image_prompt=image_prompt,
+        status="draft"
+    )
+
+async def write_platform_post(llm, platform: Platform, role_description: str, prompt: str, semaphore: asyncio.Semaphore) -> GeneratedPost:
+    """Generates a post for one platform, bounded by the shared semaphore."""
+    messages = [
+        SystemMessage(content=role_description),
+        HumanMessage(content=prompt)
+    ]
+    
+    async with semaphore:
+        response = await llm.ainvoke(messages)
+    
+    return parse_post(platform, response.content)
+
+def build_combined_prompt(platforms: list, voice_instruction: str, analysis, context_str: str) -> str:
+    """Builds one prompt that asks for every platform in a single JSON response."""
+    style_guides = "\n".join(
+        f"""
+            [{platform.value}]
+            {get_style_guide(platform)}"""
+        for platform in platforms
+    )
+    keys = ", ".join(f'"{platform.value}"' for platform in platforms)
+    
+    return f"""
+            {voice_instruction}
+            
+            CRITICAL RULES:
+            1. **Perspective**: {voice_instruction}
+            2. **Language**: Every post MUST be in RUSSIAN (except for the Image Prompts).
+            3. **Structure**: Follow the Style Guide of each platform strictly.
+            4. **Grounding**: Base content on facts.
+            
+            Analysis:
+            - Summary: {analysis.summary}
+            - Facts: {", ".join(analysis.facts)}
+            - Sentiment: {analysis.sentiment}
+            - PR Verdict: {analysis.pr_verdict} ({analysis.pr_reasoning})
+            
+            Brand Context:
+            {context_str}
+            
+            Style Guides:
+            {style_guides}
+            
+            REQUIRED OUTPUT FORMAT:
+            Output ONLY valid JSON, one key per platform: {keys}.
+            Each value is an object:
+            {{"content": "final post text (for Email/Press Release include the headers)", "image_prompt": "Image Prompt in English"}}
+            """
+
+def _normalize_platform_key(key: str) -> str:
+    return re.sub(r"[\s\-]+", "_", str(key).strip().lower())
+
+def parse_combined_posts(raw: str, platforms: list) -> dict:
+    """Maps a combined JSON response to GeneratedPost objects; unusable entries are skipped."""
+    try:
+        data = parse_json_tolerant(raw)
+    except Exception as e:
+        print(f"Writer JSON Parse Error: {e}")
+        return {}
+    
+    # Accept "telegram", "TELEGRAM", "press release", "press-release"...
+    by_key = {_normalize_platform_key(k): v for k, v in data.items()}
+    
+    posts = {}
+    for platform in platforms:
+        value = by_key.get(platform.value)
+        if value is None:
+            value = by_key.get(_normalize_platform_key(platform.name))
+        
+        if isinstance(value, str) and value.strip():
+            # Model ignored the object format but kept the "|||" convention
+            posts[platform] = parse_post(platform, value)
+        elif isinstance(value, dict):
+            content = value.get("content") or value.get("text") or value.get("post")
+            if not isinstance(content, str) or not content.strip():
+                continue
+            image_prompt = value.get("image_prompt") or value.get("imagePrompt")
+            if not isinstance(image_prompt, str) or not image_prompt.strip():
+                image_prompt = DEFAULT_IMAGE_PROMPT
+            posts[platform] = GeneratedPost(
+                platform=platform,
+                content=content.strip(),
+                image_prompt=image_prompt.strip(),
+                status="draft"
+            )
+    return posts
+
+async def write_posts_single_call(llm, platforms: list, role_description: str, voice_instruction: str, analysis, context_str: str) -> dict:
+    """Generates all platforms with one LLM call. Returns whatever could be parsed."""
+    messages = [
+        SystemMessage(content=role_description + " Output ONLY JSON."),
+        HumanMessage(content=build_combined_prompt(platforms, voice_instruction, analysis, context_str))
+    ]
+    
+    try:
+        response = await llm.ainvoke(messages)
+    except Exception as e:
+        print(f"Writer Single-Call Error: {e}")
+        return {}
+    
+    return parse_combined_posts(response.content, platforms)
+
+async def writer_node(state: AgentState) -> AgentState:
     """Generates posts based on analysis and context."""
     
     if state.get("errors"):
@@ -19,22 +228,17 @@ def writer_node(state: AgentState) -> AgentState:
 
     context = state.get('context', [])
     context_str = "\n".join(context)
-    
-    # Define platforms and their specific strategies
-    platforms = [
-        Platform.TELEGRAM, 
-        Platform.VK, 
-        Platform.TENCHAT,
-        Platform.VC,
-        Platform.DZEN,
-        Platform.EMAIL,
-        Platform.PRESS_RELEASE
-    ]
+    task_id = state.get("task_id")
     
     posts = []
     
     try:
-        llm = get_llm(model_provider)
+        # Fails over along LLM_CASCADE when the provider errors or its circuit is open;
+        # hedged against a second provider when LLM_HEDGE_POLICY covers this mode/category (e.g. CRISIS)
+        llm = get_routed_llm(
+            model_provider,
+            hedge=should_hedge("writer", state.get("mode", "pr"), getattr(analysis, "category", None))
+        )
         
         # Extract brand name and mode safely
         mode = state.get("mode", "pr")
@@ -86,95 +290,53 @@ def writer_node(state: AgentState) -> AgentState:
             role_description = f"You are the Head of Communications for {brand_name}."
             voice_instruction = f"Write AS {brand_name}. You are the official voice of the brand."
 
-        for platform in platforms:
-            # Define specific constraints per platform
-            if platform == Platform.EMAIL:
-                style_guide = """
-                ФОРМАТ СЛУЖЕБНОЙ ЗАПИСКИ.
-                Структура:
-                Тема: [Четкая, побуждающая к действию тема]
-                Кому: [Целевые стейкхолдеры]
-                Рекомендация: [Конкретный совет]
-                
-                Текст:
-                [Краткий анализ ситуации и обоснование позиции. Официально, но прямо.]
-                """
-            elif platform == Platform.PRESS_RELEASE:
-                style_guide = """
-                ФОРМАТ ОФИЦИАЛЬНОГО ПРЕСС-РЕЛИЗА.
-                Структура:
-                ДЛЯ НЕМЕДЛЕННОГО РАСПРОСТРАНЕНИЯ
-                
-                [ЗАГОЛОВОК]
-                
-                [Город, Дата] — [Лид-абзац]
-                
-                [Основной текст]
-                
-                [О компании]
-                
-                Контакты для СМИ:
-                [Имя/Email]
-                """
-            elif platform == Platform.TELEGRAM:
-                style_guide = "Telegram Channel Style. Use Markdown (*bold*) and Emojis 🚀. Short paragraphs."
+        generated = {}
+        if WRITER_MODE == "single":
+            # Shared analysis/context prefix is sent once instead of once per platform
+            generated = await write_posts_single_call(
+                llm, PLATFORMS, role_description, voice_instruction, analysis, context_str
+            )
+            for platform in generated:
+                await publish_progress(task_id, "platform", platform=platform.value)
+        
+        # Per-platform calls for everything still missing (all platforms in "parallel" mode)
+        missing = [platform for platform in PLATFORMS if platform not in generated]
+        if WRITER_MODE == "single" and missing:
+            print(f"Writer: falling back to per-platform calls for {[p.value for p in missing]}")
+        
+        # Fan out all platforms at once; failures stay per-platform
+        semaphore = asyncio.Semaphore(max(1, WRITER_CONCURRENCY))
+        
+        async def write_and_report(platform: Platform) -> GeneratedPost:
+            post = await write_platform_post(
+                llm,
+                platform,
+                role_description,
+                build_platform_prompt(platform, voice_instruction, analysis, context_str),
+                semaphore
+            )
+            await publish_progress(task_id, "platform", platform=platform.value)
+            return post
+        
+        results = await asyncio.gather(*[
+            write_and_report(platform) for platform in missing
+        ], return_exceptions=True)
+        
+        failed = []
+        for platform, result in zip(missing, results):
+            if isinstance(result, Exception):
+                print(f"Writer Error ({platform.value}): {result}")
+                failed.append(f"{platform.value}: {result}")
             else:
-                style_guide = "Engaging social media style. Emojis allowed. NO Markdown headers. Ready to publish."
-
-            prompt = f"""
-            {voice_instruction}
-            
-            CRITICAL RULES:
-            1. **Perspective**: {voice_instruction}
-            2. **Language**: The post MUST be in RUSSIAN (except for the Image Prompt).
-            3. **Structure**: Follow the Style Guide for {platform.value} strictly.
-            4. **Grounding**: Base content on facts.
-            
-            Analysis:
-            - Summary: {analysis.summary}
-            - Facts: {", ".join(analysis.facts)}
-            - Sentiment: {analysis.sentiment}
-            - PR Verdict: {analysis.pr_verdict} ({analysis.pr_reasoning})
-            
-            Brand Context:
-            {context_str}
-            
-            Style Guide: {style_guide}
-            
-            REQUIRED OUTPUT FORMAT:
-            1. Output ONLY the final post text.
-            2. For Email/Press Release, include the headers (Subject, Title) as part of the text.
-            3. Do NOT include "Image Prompt:" label.
-            
-            At the very end, strictly separated by "|||", provide the Image Prompt in English.
-            """
-            
-            messages = [
-                SystemMessage(content=role_description),
-                HumanMessage(content=prompt)
-            ]
-            
-            response = llm.invoke(messages)
-            
-            # Parse content and image prompt
-            full_content = response.content
-            content = full_content
-            image_prompt = "Abstract modern technology, 4k, digital art" # Default
-            
-            if "|||" in full_content:
-                parts = full_content.split("|||")
-                content = parts[0].strip()
-                if len(parts) > 1:
-                    image_prompt = parts[1].strip()
-            
-            posts.append(GeneratedPost(
-                platform=platform,
-                content=content,
-                image_prompt=image_prompt,
-                status="draft"
-            ))
+                generated[platform] = result
+        
+        # Keep the canonical platform order
+        posts = [generated[platform] for platform in PLATFORMS if platform in generated]
+        
+        if not posts:
+            return {"errors": [f"Writer LLM Error: {'; '.join(failed)}"], "retryable": True}
             
     except Exception as e:
-        return {"errors": [f"Writer LLM Error: {str(e)}"]}
+        return {"errors": [f"Writer LLM Error: {str(e)}"], "retryable": True}
         
     return {"posts": posts}
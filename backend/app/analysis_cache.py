@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import re
+import time
+from typing import Optional
+
+from app.models import NewsAnalysis
+from app.redis_client import redis_client
+
+# Constants
+ANALYSIS_CACHE_TTL = int(os.getenv("ANALYSIS_CACHE_TTL", "86400"))  # 1 day
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "5000"))
+
+INDEX_KEY = "analysis_cache:index"  # ZSET: cache key -> last access time (for LRU eviction)
+STATS_KEY = "analysis_cache:stats"  # HASH: hits / misses
+
+def normalize_text(text: str) -> str:
+    """Collapses whitespace so re-scraped copies of the same article hash equally."""
+    return re.sub(r"\s+", " ", text or "").strip()
+
+def _profile_payload(brand_profile):
+    if brand_profile is None:
+        return None
+    if hasattr(brand_profile, "dict"):
+        return brand_profile.dict()
+    return brand_profile
+
+def make_cache_key(news_text: str, brand_profile, mode: str, target_brand: Optional[str], model_provider: str) -> str:
+    """Content-addressed key: the same article for the same brand/mode/model maps to one entry."""
+    payload = json.dumps({
+        "text": normalize_text(news_text),
+        "brand_profile": _profile_payload(brand_profile),
+        "mode": mode,
+        "target_brand": target_brand,
+        "model_provider": model_provider,
+    }, sort_keys=True, ensure_ascii=False, default=str)
+    digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    return f"analysis_cache:{digest}"
+
+async def get_cached_analysis(key: str) -> Optional[NewsAnalysis]:
+    """Returns the cached analysis or None. Counts hits and misses."""
+    try:
+        raw = await redis_client.get(key)
+        async with redis_client.pipeline(transaction=False) as pipe:
+            if raw:
+                pipe.zadd(INDEX_KEY, {key: time.time()})
+                pipe.hincrby(STATS_KEY, "hits", 1)
+            else:
+                pipe.hincrby(STATS_KEY, "misses", 1)
+            await pipe.execute()
+
+        if raw:
+            return NewsAnalysis(**json.loads(raw))
+    except Exception as e:
+        print(f"Analysis Cache Read Error: {e}")
+    return None
+
+async def cache_analysis(key: str, analysis: NewsAnalysis):
+    """Stores an analysis with TTL and evicts least recently used entries over the size cap."""
+    try:
+        now = time.time()
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.setex(key, ANALYSIS_CACHE_TTL, json.dumps(analysis.dict(), ensure_ascii=False))
+            pipe.zadd(INDEX_KEY, {key: now})
+            # Entries that already expired by TTL
+            pipe.zremrangebyscore(INDEX_KEY, 0, now - ANALYSIS_CACHE_TTL)
+            pipe.zcard(INDEX_KEY)
+            results = await pipe.execute()
+
+        overflow = results[-1] - ANALYSIS_CACHE_MAX_ENTRIES
+        if overflow > 0:
+            oldest = await redis_client.zrange(INDEX_KEY, 0, overflow - 1)
+            if oldest:
+                async with redis_client.pipeline(transaction=False) as pipe:
+                    pipe.delete(*oldest)
+                    pipe.zrem(INDEX_KEY, *oldest)
+                    await pipe.execute()
+    except Exception as e:
+        print(f"Analysis Cache Write Error: {e}")
+
+async def get_cache_stats() -> dict:
+    """Hit/miss counters for measuring savings."""
+    try:
+        stats = await redis_client.hgetall(STATS_KEY)
+        entries = await redis_client.zcard(INDEX_KEY)
+    except Exception as e:
+        print(f"Analysis Cache Stats Error: {e}")
+        return {}
+
+    hits = int(stats.get("hits", 0))
+    misses = int(stats.get("misses", 0))
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / total, 4) if total else 0.0,
+        "entries": entries,
+        "max_entries": ANALYSIS_CACHE_MAX_ENTRIES,
+        "ttl": ANALYSIS_CACHE_TTL,
+    }
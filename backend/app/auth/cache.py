@@ -0,0 +1,61 @@
+import json
+import os
+from datetime import datetime
+from typing import Optional
+
+from app.auth.models import User
+from app.redis_client import redis_client
+
+# Cached snapshots of authenticated users. Writes to the users table must drop the snapshot:
+# in the API use commit_user_changes (or invalidate_user after a commit); scripts and manual SQL
+# should delete user_cache:{id} (see scripts/reset_telegram_link.py). Any write that doesn't is
+# served stale for up to USER_CACHE_TTL seconds.
+
+# Constants
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "60"))  # seconds; writes invalidate explicitly
+
+def get_user_cache_key(user_id: int) -> str:
+    return f"user_cache:{user_id}"
+
+def _snapshot(user: User) -> dict:
+    # No password hash in Redis: authenticated requests never need it
+    return {
+        "id": user.id,
+        "email": user.email,
+        "full_name": user.full_name,
+        "created_at": user.created_at.isoformat() if user.created_at else None,
+        "brand_profile": user.brand_profile,
+        "telegram_chat_id": user.telegram_chat_id,
+    }
+
+async def get_cached_user(user_id: int) -> Optional[User]:
+    """Returns a detached User built from the snapshot, or None."""
+    try:
+        raw = await redis_client.get(get_user_cache_key(user_id))
+    except Exception as e:
+        print(f"User Cache Read Error: {e}")
+        return None
+    if not raw:
+        return None
+    data = json.loads(raw)
+    if data.get("created_at"):
+        data["created_at"] = datetime.fromisoformat(data["created_at"])
+    return User(**data)
+
+async def cache_user(user: User):
+    try:
+        await redis_client.setex(get_user_cache_key(user.id), USER_CACHE_TTL, json.dumps(_snapshot(user), ensure_ascii=False))
+    except Exception as e:
+        print(f"User Cache Write Error: {e}")
+
+async def commit_user_changes(db, user: User):
+    """Commits pending changes to a users row and drops its cached snapshot."""
+    await db.commit()
+    await invalidate_user(user.id)
+
+async def invalidate_user(user_id: int):
+    """Call after any change to the users row (profile, Telegram link)."""
+    try:
+        await redis_client.delete(get_user_cache_key(user_id))
+    except Exception as e:
+        print(f"User Cache Invalidation Error: {e}")
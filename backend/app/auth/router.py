@@ -1,7 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
-from app.database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_db, get_async_db, AsyncSessionLocal
 from app.auth.models import User
+from app.auth.cache import get_cached_user, cache_user, commit_user_changes
 from app.auth.utils import get_password_hash, verify_password, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
 from pydantic import BaseModel
 from datetime import timedelta
@@ -55,13 +57,30 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
     return {"access_token": access_token, "token_type": "bearer"}
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
+oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="auth/login", auto_error=False)
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    return await get_user_from_token(token)
+
+async def get_current_user_from_query(
+    header_token: str | None = Depends(oauth2_scheme_optional),
+    token: str | None = None
+):
+    """Same as get_current_user, but also accepts ?token= (EventSource/WebSocket can't set headers)."""
+    return await get_user_from_token(header_token or token)
+
+async def get_user_from_token(token: str | None) -> User:
+    """
+    Decodes the JWT and returns the user from the short-lived cache (app/auth/cache.py),
+    falling back to the database. The returned User is detached: load it in a session to modify.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    if not token:
+        raise credentials_exception
     try:
         payload = jwt.decode(token, os.getenv("SECRET_KEY", "supersecretkey"), algorithms=["HS256"])
         email: str = payload.get("sub")
@@ -71,9 +90,15 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     except Exception: # JWTError
         raise credentials_exception
     
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await get_cached_user(user_id)
+    if user is not None:
+        return user
+    
+    async with AsyncSessionLocal() as db:
+        user = await db.get(User, user_id)
     if user is None:
         raise credentials_exception
+    await cache_user(user)
     return user
 
 class UserProfile(BaseModel):
@@ -95,19 +120,20 @@ def get_brand_profile(current_user: User = Depends(get_current_user)):
     return current_user.brand_profile or {}
 
 @router.put("/profile")
-def update_brand_profile(profile: dict, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def update_brand_profile(profile: dict, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
     """Updates the user's brand profile."""
-    current_user.brand_profile = profile
-    db.commit()
-    db.refresh(current_user)
-    return {"status": "saved", "profile": current_user.brand_profile}
+    user = await db.get(User, current_user.id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    user.brand_profile = profile
+    await commit_user_changes(db, user)
+    return {"status": "saved", "profile": user.brand_profile}
 
 # --- Telegram Linking ---
-import redis
 import random
 import string
 
-redis_client = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://redis:6379/0"), decode_responses=True)
+from app.redis_client import redis_client
 
 class LinkTokenResponse(BaseModel):
     token: str
@@ -118,14 +144,14 @@ class LinkRequest(BaseModel):
     telegram_chat_id: str
 
 @router.post("/telegram/link-token", response_model=LinkTokenResponse)
-def generate_link_token(current_user: User = Depends(get_current_user)):
+async def generate_link_token(current_user: User = Depends(get_current_user)):
     """Generates a short code to link Telegram."""
     # Generate 6-digit code
     token = "".join(random.choices(string.digits, k=6))
     
     # Store in Redis: link_code:123456 -> user_id
     # TTL: 10 minutes
-    redis_client.setex(f"link_code:{token}", 600, str(current_user.id))
+    await redis_client.setex(f"link_code:{token}", 600, str(current_user.id))
     
     bot_name = os.getenv("BOT_USERNAME", "RezonansAI_bot") # Should match your bot
     return {
@@ -134,25 +160,25 @@ def generate_link_token(current_user: User = Depends(get_current_user)):
     }
 
 @router.post("/telegram/link")
-def link_telegram(req: LinkRequest, db: Session = Depends(get_db)):
+async def link_telegram(req: LinkRequest, db: AsyncSession = Depends(get_async_db)):
     """
     Internal endpoint called by Bot to finalize linking.
     No Auth required (or use secret header in prod).
     """
     # 1. Validate Token
-    user_id = redis_client.get(f"link_code:{req.token}")
+    user_id = await redis_client.get(f"link_code:{req.token}")
     if not user_id:
         raise HTTPException(status_code=400, detail="Invalid or expired token")
     
     # 2. Update User
-    user = db.query(User).filter(User.id == int(user_id)).first()
+    user = await db.get(User, int(user_id))
     if not user:
          raise HTTPException(status_code=404, detail="User not found")
     
     user.telegram_chat_id = req.telegram_chat_id
-    db.commit()
+    await commit_user_changes(db, user)
     
     # 3. Cleanup
-    redis_client.delete(f"link_code:{req.token}")
+    await redis_client.delete(f"link_code:{req.token}")
     
     return {"status": "linked", "user_email": user.email}
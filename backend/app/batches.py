@@ -0,0 +1,212 @@
+import hashlib
+import json
+import os
+import uuid
+from datetime import datetime
+from typing import List, Dict, Optional
+
+from app.models import NewsInput
+from app.redis_client import redis_client
+from app.task_queue import (
+    get_task_key, get_user_batch_tasks_key, decode_task, job_fields, TaskStatus, TASK_TTL, JOB_STREAM
+)
+from app.analysis_cache import normalize_text
+from app.utils.scrape_cache import canonicalize_url
+
+# Constants
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "50"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "5"))  # jobs of one batch in the queue at a time
+BATCH_USER_CONCURRENCY = int(os.getenv("BATCH_USER_CONCURRENCY", "5"))  # batch jobs of one user (all batches, incl. monitoring)
+BATCH_TTL = TASK_TTL
+
+def get_batch_key(batch_id: str) -> str:
+    return f"batch:{batch_id}"  # HASH: id, user_id, total, enqueued, ready, error, created_at
+
+def get_batch_items_key(batch_id: str) -> str:
+    return f"batch:{batch_id}:items"  # LIST: task_id per input item (duplicates repeat the task_id)
+
+def get_batch_queue_key(batch_id: str) -> str:
+    return f"batch:{batch_id}:queue"  # LIST: job payloads not yet released to workers
+
+def get_user_batches_key(user_id: int) -> str:
+    return f"user_batches:{user_id}"  # SET: the user's batches that still have queued jobs
+
+# Sliding window: releases queued jobs to the stream while the batch has fewer than ARGV[2]
+# and the user fewer than ARGV[3] batch jobs in flight (across all their batches).
+# Safe to call any number of times. Counters ready/error are maintained by the task status script.
+# ARGV[5] is the task whose job just ran: if its hash expired before the job could update it,
+# it is counted as an error here (SREM from the in-flight set makes that happen once).
+# Every call refreshes the TTL of the batch and its tasks, so a long batch doesn't expire mid-run.
+# Task keys are built from the ids in the items list: assumes a single Redis node, not Cluster.
+# KEYS: batch, queue, items, stream, user in-flight set, user batch set
+# ARGV: batch_id, batch concurrency, user concurrency, ttl, finished task_id or ''
+REFILL_BATCH_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    redis.call('SREM', KEYS[6], ARGV[1])
+    return 0
+end
+if ARGV[5] ~= '' and redis.call('EXISTS', 'task:' .. ARGV[5]) == 0 then
+    if redis.call('SREM', KEYS[5], ARGV[5]) == 1 then
+        redis.call('HINCRBY', KEYS[1], 'error', 1)
+    end
+end
+local enqueued = tonumber(redis.call('HGET', KEYS[1], 'enqueued') or '0')
+local finished = tonumber(redis.call('HGET', KEYS[1], 'ready') or '0') + tonumber(redis.call('HGET', KEYS[1], 'error') or '0')
+local free = math.min(tonumber(ARGV[2]) - (enqueued - finished), tonumber(ARGV[3]) - redis.call('SCARD', KEYS[5]))
+local added = 0
+while added < free do
+    local payload = redis.call('LPOP', KEYS[2])
+    if not payload then break end
+    local fields = cjson.decode(payload)
+    local args = {}
+    for key, value in pairs(fields) do
+        table.insert(args, key)
+        table.insert(args, value)
+    end
+    redis.call('XADD', KEYS[4], '*', unpack(args))
+    redis.call('SADD', KEYS[5], fields['task_id'])
+    added = added + 1
+end
+if added > 0 then
+    redis.call('HINCRBY', KEYS[1], 'enqueued', added)
+end
+if redis.call('LLEN', KEYS[2]) == 0 then
+    redis.call('SREM', KEYS[6], ARGV[1])
+end
+for _, key in ipairs({KEYS[1], KEYS[2], KEYS[3], KEYS[5], KEYS[6]}) do
+    redis.call('EXPIRE', key, ARGV[4])
+end
+for _, task_id in ipairs(redis.call('LRANGE', KEYS[3], 0, -1)) do
+    redis.call('EXPIRE', 'task:' .. task_id, ARGV[4])
+end
+return added
+"""
+
+refill_batch_script = redis_client.register_script(REFILL_BATCH_SCRIPT)
+
+def dedupe_key(news: NewsInput) -> str:
+    """Same article (URL variant or text) with the same generation options is processed once."""
+    source = canonicalize_url(news.url) if news.url else normalize_text(news.text)
+    raw = "|".join([source, news.mode or "pr", news.target_brand or "", news.model_provider or ""])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+async def create_batch(user_id: int, items: List[NewsInput]) -> Dict:
+    """
+    Creates one task per unique item and releases the first BATCH_CONCURRENCY of them to workers
+    (fewer if the user already has BATCH_USER_CONCURRENCY batch jobs in flight).
+    Returns the batch id and, per input item, the task it maps to.
+    """
+    batch_id = str(uuid.uuid4())
+    now = datetime.now().isoformat()
+
+    task_ids: List[str] = []
+    unique: Dict[str, str] = {}  # dedupe key -> task_id
+    async with redis_client.pipeline(transaction=True) as pipe:
+        for news in items:
+            key = dedupe_key(news)
+            if key in unique:
+                task_ids.append(unique[key])
+                continue
+            task_id = str(uuid.uuid4())
+            unique[key] = task_id
+            task_ids.append(task_id)
+
+            pipe.hset(get_task_key(task_id), mapping={
+                "id": task_id,
+                "user_id": user_id,
+                "batch_id": batch_id,
+                "status": TaskStatus.PENDING.value,
+                "created_at": now,
+                "updated_at": now,
+            })
+            pipe.expire(get_task_key(task_id), TASK_TTL)
+            pipe.rpush(get_batch_queue_key(batch_id), json.dumps(job_fields(task_id, news, user_id, 1, batch_id), ensure_ascii=False))
+
+        pipe.hset(get_batch_key(batch_id), mapping={
+            "id": batch_id,
+            "user_id": user_id,
+            "total": len(unique),
+            "enqueued": 0,
+            "ready": 0,
+            "error": 0,
+            "created_at": now,
+        })
+        pipe.rpush(get_batch_items_key(batch_id), *task_ids)
+        for key in (get_batch_key(batch_id), get_batch_items_key(batch_id), get_batch_queue_key(batch_id)):
+            pipe.expire(key, BATCH_TTL)
+        pipe.sadd(get_user_batches_key(user_id), batch_id)
+        await pipe.execute()
+
+    await refill_batch(batch_id, user_id)
+
+    first_index: Dict[str, int] = {}
+    result_items = []
+    for index, task_id in enumerate(task_ids):
+        item = {"index": index, "task_id": task_id}
+        if task_id in first_index:
+            item["duplicate_of"] = first_index[task_id]
+        else:
+            first_index[task_id] = index
+        result_items.append(item)
+
+    return {"batch_id": batch_id, "total": len(items), "unique": len(unique), "items": result_items}
+
+async def refill_batch(batch_id: str, user_id: int, finished_task_id: Optional[str] = None) -> int:
+    """Releases queued jobs of a batch into free slots. Called on creation and whenever a batch job finishes."""
+    return await refill_batch_script(
+        keys=[
+            get_batch_key(batch_id), get_batch_queue_key(batch_id), get_batch_items_key(batch_id), JOB_STREAM,
+            get_user_batch_tasks_key(user_id), get_user_batches_key(user_id)
+        ],
+        args=[batch_id, BATCH_CONCURRENCY, BATCH_USER_CONCURRENCY, BATCH_TTL, finished_task_id or ""]
+    )
+
+async def refill_user_batches(user_id: int, batch_id: str, finished_task_id: str) -> int:
+    """
+    A batch job finished: refills its batch first, then the user's other batches,
+    which may have been waiting for a slot under BATCH_USER_CONCURRENCY.
+    """
+    added = await refill_batch(batch_id, user_id, finished_task_id)
+    for other_id in await redis_client.smembers(get_user_batches_key(user_id)):
+        if other_id != batch_id:
+            added += await refill_batch(other_id, user_id)
+    return added
+
+async def get_batch(batch_id: str) -> Optional[Dict]:
+    """Aggregate progress plus per-item task status and results."""
+    batch = await redis_client.hgetall(get_batch_key(batch_id))
+    if not batch:
+        return None
+    task_ids = await redis_client.lrange(get_batch_items_key(batch_id), 0, -1)
+
+    unique_ids = list(dict.fromkeys(task_ids))
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for task_id in unique_ids:
+            pipe.hgetall(get_task_key(task_id))
+        results = await pipe.execute()
+    tasks = {task_id: decode_task(task_id, fields) for task_id, fields in zip(unique_ids, results)}
+
+    total, ready, error = int(batch["total"]), int(batch.get("ready", 0)), int(batch.get("error", 0))
+    items = []
+    for index, task_id in enumerate(task_ids):
+        task = tasks.get(task_id) or {}
+        items.append({
+            "index": index,
+            "task_id": task_id,
+            "status": task.get("status", "expired"),
+            "data": task.get("data"),
+            "error": task.get("error"),
+        })
+
+    return {
+        "id": batch_id,
+        "user_id": int(batch["user_id"]),
+        "status": "done" if ready + error >= total else "processing",
+        "total": total,
+        "ready": ready,
+        "error": error,
+        "processing": max(0, int(batch.get("enqueued", 0)) - ready - error),
+        "queued": max(0, total - int(batch.get("enqueued", 0))),
+        "created_at": batch.get("created_at"),
+        "items": items,
+    }
@@ -0,0 +1,127 @@
+import json
+from app.models import NewsInput, MediaPlan
+from app.agents.graph import app as agent_app
+from app.task_queue import redis_client, update_task_status, TaskStatus
+from app.progress import publish_progress
+
+async def run_generation_task(task_id: str, news: NewsInput, user_id: int, final_attempt: bool = True) -> bool:
+    """
+    Runs the actual generation for a queued task.
+    If this is not the final attempt, exceptions (LLM/transport/storage) are re-raised so the
+    worker can retry. Errors reported by the graph nodes fail the task at once.
+    Returns True on success (or if there was nothing to do), False if the task failed.
+    """
+    from app.storage import async_storage
+
+    telegram_chat_id = None
+    try:
+        if not await update_task_status(task_id, TaskStatus.PROCESSING):
+            # Already finished (e.g. a duplicate delivery) or expired: nothing to do
+            print(f"Generation: task {task_id} is finished or expired, skipping")
+            return True
+        await publish_progress(task_id, "processing")
+
+        # Run the LangGraph workflow with user context and mode
+        initial_state = {
+            "task_id": task_id,
+            "input": news,
+            "user_id": user_id,
+            "mode": news.mode or "pr",
+            "target_brand": news.target_brand,
+            "errors": []
+        }
+        # Stream node updates so progress can be pushed as each agent finishes
+        result = dict(initial_state)
+        async for chunk in agent_app.astream(initial_state, stream_mode="updates"):
+            for node_name, update in chunk.items():
+                if update:
+                    result.update(update)
+                await publish_progress(task_id, "node", node=node_name, ok=not (update or {}).get("errors"))
+
+        if result.get("errors"):
+            if result.get("retryable"):
+                # All LLM providers failed: let the worker retry with backoff
+                raise RuntimeError(str(result['errors']))
+            # Other node errors (scraping failed, no brand profile, ...) won't change on retry
+            await fail_task(task_id, user_id, str(result['errors']))
+            return False
+
+        # Construct response
+        final_input = result.get("input", news)
+
+        plan = MediaPlan(
+            id=task_id,  # Use task_id as plan_id
+            original_news=final_input,
+            analysis=result["analysis"],
+            posts=result["posts"]
+        )
+
+        # Save to MinIO History (User specific); a failed save is retried like any other transient error
+        if not await async_storage.save_generation(user_id, plan.id, plan.dict()):
+            raise RuntimeError("Failed to save the plan to history")
+
+        # Update task with result
+        await update_task_status(task_id, TaskStatus.READY, data=plan.dict())
+        await publish_progress(task_id, "ready", plan=plan.dict())
+
+        # Get Telegram Chat ID
+        try:
+            from app.database import SessionLocal
+            from app.auth.models import User
+            with SessionLocal() as db:
+                user_obj = db.query(User).filter(User.id == user_id).first()
+                if user_obj:
+                    telegram_chat_id = user_obj.telegram_chat_id
+        except Exception as e:
+            print(f"Error fetching User for notification: {e}")
+
+        # Publish Notification to Redis
+        try:
+            # Find the best post (e.g. Telegram or first available)
+            best_post = next((p for p in plan.posts if p.platform == "telegram"), plan.posts[0] if plan.posts else None)
+            post_content = best_post.content if best_post else "Нет сгенерированного поста."
+
+            await redis_client.publish("task_updates", json.dumps({
+                "type": "task_completed",
+                "task_id": task_id,
+                "user_id": user_id,
+                "telegram_chat_id": telegram_chat_id,
+                "summary": plan.analysis.summary,
+                "score": plan.analysis.relevance_score,
+                "verdict": plan.analysis.pr_verdict,
+                "post_content": post_content,
+                "status": "ready"
+            }))
+        except Exception as e:
+            print(f"Redis Publish Error: {e}")
+
+        return True
+
+    except Exception as e:
+        print(f"Generation Error: {e}")
+        if not final_attempt:
+            # Task stays "processing"; the worker schedules a retry
+            await publish_progress(task_id, "retry", error=str(e))
+            raise
+
+        import traceback
+        traceback.print_exc()
+        await fail_task(task_id, user_id, str(e), telegram_chat_id)
+        return False
+
+async def fail_task(task_id: str, user_id: int, error: str, telegram_chat_id=None):
+    """Marks the task as failed and notifies the dashboard and the bot."""
+    await update_task_status(task_id, TaskStatus.ERROR, error=error)
+    await publish_progress(task_id, "error", error=error)
+
+    # Publish Error Notification
+    try:
+        await redis_client.publish("task_updates", json.dumps({
+            "type": "task_error",
+            "task_id": task_id,
+            "user_id": user_id,
+            "telegram_chat_id": telegram_chat_id,
+            "error": error
+        }))
+    except:
+        pass
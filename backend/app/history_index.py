@@ -0,0 +1,154 @@
+import base64
+import time
+from datetime import datetime
+from typing import Optional, Tuple, List
+
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, JSON, Index, tuple_, select
+
+from app.database import Base, SessionLocal, AsyncSessionLocal
+
+class PlanIndexEntry(Base):
+    """Lightweight projection of a plan stored in MinIO, used by /history."""
+    __tablename__ = "plan_index"
+
+    id = Column(String, primary_key=True)  # plan_id
+    user_id = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    summary = Column(Text, nullable=True)
+    relevance_score = Column(Integer, nullable=True)
+    pr_verdict = Column(String, nullable=True)
+    category = Column(String, nullable=True)
+    sentiment = Column(String, nullable=True)
+    topics = Column(JSON, nullable=True)
+    liked = Column(Boolean, default=False)
+
+    __table_args__ = (
+        Index("ix_plan_index_user_created", "user_id", "created_at", "id"),
+    )
+
+    def to_projection(self) -> dict:
+        # Same shape as the full plan for the fields the history list uses
+        return {
+            "id": self.id,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "liked": bool(self.liked),
+            "analysis": {
+                "summary": self.summary,
+                "relevance_score": self.relevance_score,
+                "pr_verdict": self.pr_verdict,
+                "category": self.category,
+                "sentiment": self.sentiment,
+                "topics": self.topics or [],
+            },
+        }
+
+class PlanIndexBackfill(Base):
+    """Migration marker: the user's plans saved before the index existed have been indexed."""
+    __tablename__ = "plan_index_backfill"
+
+    user_id = Column(Integer, primary_key=True)
+    completed_at = Column(DateTime(timezone=True), nullable=False)
+    plans = Column(Integer, nullable=False, default=0)
+
+# Users known to be backfilled -> when that was checked (skips the marker query on most /history calls).
+# Re-checked after BACKFILL_CHECK_TTL so a marker cleared by another process is noticed.
+BACKFILL_CHECK_TTL = 60
+_backfilled = {}
+
+def _parse_created_at(value) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            pass
+    return datetime.now()
+
+def _build_entry(user_id: int, plan_id: str, data: dict) -> PlanIndexEntry:
+    analysis = data.get("analysis") or {}
+    return PlanIndexEntry(
+        id=plan_id,
+        user_id=user_id,
+        created_at=_parse_created_at(data.get("created_at")),
+        summary=analysis.get("summary"),
+        relevance_score=analysis.get("relevance_score"),
+        pr_verdict=analysis.get("pr_verdict"),
+        category=analysis.get("category"),
+        sentiment=analysis.get("sentiment"),
+        topics=analysis.get("topics"),
+        liked=bool(data.get("liked", False)),
+    )
+
+def upsert_plan_index(user_id: int, plan_id: str, data: dict):
+    """
+    Writes the index row for a plan (called on every save to MinIO, from the storage thread pool).
+    If that fails, the user's backfill marker is cleared so the next /history re-indexes from MinIO;
+    if even that fails, the error is raised and the save is reported as failed.
+    """
+    entry = _build_entry(user_id, plan_id, data)
+    try:
+        with SessionLocal() as db:
+            db.merge(entry)
+            db.commit()
+        return
+    except Exception as e:
+        print(f"History Index Write Error: {e}")
+
+    with SessionLocal() as db:
+        db.query(PlanIndexBackfill).filter(PlanIndexBackfill.user_id == user_id).delete()
+        db.commit()
+    _backfilled.pop(user_id, None)
+
+def encode_cursor(entry: PlanIndexEntry) -> str:
+    raw = f"{entry.created_at.isoformat()}|{entry.id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+    created_at, plan_id = raw.split("|", 1)
+    return datetime.fromisoformat(created_at), plan_id
+
+async def ensure_backfilled(user_id: int):
+    """
+    One-time migration per user: indexes every plan already in MinIO, then writes the marker.
+    The marker is only written after a complete listing; if MinIO fails, it is retried next call.
+    Safe to run twice concurrently (rows and marker are merged by primary key).
+    """
+    from app.storage import async_storage
+
+    checked_at = _backfilled.get(user_id)
+    if checked_at is not None and time.monotonic() - checked_at < BACKFILL_CHECK_TTL:
+        return
+    async with AsyncSessionLocal() as db:
+        if await db.get(PlanIndexBackfill, user_id) is None:
+            try:
+                plans = await async_storage.list_all_generations(user_id)
+            except Exception as e:
+                # No marker: the next /history call retries the backfill
+                print(f"History Index Backfill Error (user {user_id}): {e}")
+                return
+            for plan in plans:
+                if plan and plan.get("id"):
+                    await db.merge(_build_entry(user_id, plan["id"], plan))
+            await db.merge(PlanIndexBackfill(user_id=user_id, completed_at=datetime.now(), plans=len(plans)))
+            await db.commit()
+            print(f"History Index: backfilled {len(plans)} plan(s) for user {user_id}")
+    _backfilled[user_id] = time.monotonic()
+
+async def list_plan_index(user_id: int, limit: int = 12, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+    """
+    Returns (projections, next_cursor), newest first.
+    Keyset pagination on (created_at, id), one indexed query per page.
+    """
+    query = select(PlanIndexEntry).where(PlanIndexEntry.user_id == user_id)
+    if cursor:
+        created_at, plan_id = decode_cursor(cursor)
+        query = query.where(tuple_(PlanIndexEntry.created_at, PlanIndexEntry.id) < tuple_(created_at, plan_id))
+    query = query.order_by(PlanIndexEntry.created_at.desc(), PlanIndexEntry.id.desc()).limit(limit + 1)
+
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(query)).scalars().all()
+
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return [row.to_projection() for row in rows[:limit]], next_cursor
@@ -1,66 +1,136 @@
 from langchain_anthropic import ChatAnthropic
 from langchain_openai import ChatOpenAI
+import httpx
+import inspect
 import os
+import threading
 
-def get_llm(model_provider: str = "claude"):
-    """
-    Factory to get the appropriate LLM client.
-    model_provider: 'claude', 'qwen', 'deepseek'
-    """
-    
+# Models per provider
+PROVIDER_MODELS = {
+    "claude": "claude-sonnet-4-20250514",
+    "qwen": "qwen/qwen-2.5-72b-instruct",
+    "deepseek": "deepseek/deepseek-chat",  # OpenRouter alias
+    "ollama": "gpt-oss:20B",  # User specified model
+}
+
+# Connection pool / timeout settings shared by every client
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "10"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+
+# Process-wide registry: (provider, model, temperature) -> client
+_clients = {}
+_http_clients = []  # httpx clients owned by the registry
+_lock = threading.Lock()
+
+def _pool_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY
+    )
+
+def _create_llm(model_provider: str, model_name: str, temperature: float):
     if model_provider == "claude":
         api_key = os.getenv("ANTHROPIC_API_KEY")
         if not api_key:
             raise ValueError("ANTHROPIC_API_KEY is not set")
+        # The Anthropic SDK client is created lazily and cached on the instance,
+        # so reusing the instance reuses its keep-alive pool.
         return ChatAnthropic(
-            model="claude-sonnet-4-20250514",
-            api_key=api_key,
-            temperature=0.7
-        )
-        
-    elif model_provider == "qwen":
-        api_key = os.getenv("OPENROUTER_API_KEY")
-        base_url = os.getenv("OPENAI_API_BASE", "https://openrouter.ai/api/v1")
-        # Use the specific model requested or default to 72B
-        model_name = "qwen/qwen-2.5-72b-instruct"
-        
-        if not api_key:
-            raise ValueError("OPENROUTER_API_KEY is not set")
-            
-        return ChatOpenAI(
             model=model_name,
             api_key=api_key,
-            base_url=base_url,
-            temperature=0.7
+            temperature=temperature,
+            default_request_timeout=LLM_TIMEOUT,
+            max_retries=LLM_MAX_RETRIES
         )
-        
-    elif model_provider == "deepseek":
+
+    elif model_provider in ("qwen", "deepseek"):
         api_key = os.getenv("OPENROUTER_API_KEY")
         base_url = os.getenv("OPENAI_API_BASE", "https://openrouter.ai/api/v1")
-        model_name = "deepseek/deepseek-chat" # OpenRouter alias
-        
+
         if not api_key:
             raise ValueError("OPENROUTER_API_KEY is not set")
-            
+
+        http_client = httpx.Client(limits=_pool_limits(), timeout=LLM_TIMEOUT)
+        http_async_client = httpx.AsyncClient(limits=_pool_limits(), timeout=LLM_TIMEOUT)
+        _http_clients.extend([http_client, http_async_client])
+
         return ChatOpenAI(
             model=model_name,
             api_key=api_key,
             base_url=base_url,
-            temperature=0.7
+            temperature=temperature,
+            timeout=LLM_TIMEOUT,
+            max_retries=LLM_MAX_RETRIES,
+            http_client=http_client,
+            http_async_client=http_async_client
         )
-        
+
     elif model_provider == "ollama":
         from langchain_ollama import ChatOllama
         base_url = os.getenv("OLLAMA_BASE_URL", "http://host.docker.internal:11434")
-        # User specified model
-        model_name = "gpt-oss:20B" 
-        
+
+        # Passed through to the underlying httpx clients
         return ChatOllama(
             model=model_name,
             base_url=base_url,
-            temperature=0.7
+            temperature=temperature,
+            client_kwargs={"timeout": LLM_TIMEOUT, "limits": _pool_limits()}
         )
-    
-    else:
+
+    raise ValueError(f"Unknown model provider: {model_provider}")
+
+def get_llm(model_provider: str = "claude", temperature: float = 0.7):
+    """
+    Factory to get the appropriate LLM client.
+    model_provider: 'claude', 'qwen', 'deepseek', 'ollama'
+    Clients are cached per process, so repeated calls share one connection pool.
+    """
+    if model_provider not in PROVIDER_MODELS:
         # Default to Claude
-        return get_llm("claude")
+        model_provider = "claude"
+
+    model_name = PROVIDER_MODELS[model_provider]
+    key = (model_provider, model_name, temperature)
+
+    llm = _clients.get(key)
+    if llm is not None:
+        return llm
+
+    with _lock:
+        llm = _clients.get(key)
+        if llm is None:
+            llm = _create_llm(model_provider, model_name, temperature)
+            _clients[key] = llm
+    return llm
+
+async def _close_quietly(client):
+    try:
+        result = client.close() if not hasattr(client, "aclose") else client.aclose()
+        if inspect.isawaitable(result):
+            await result
+    except Exception as e:
+        print(f"LLM client close error: {e}")
+
+async def close_llm_clients():
+    """Closes every pooled client. Called on app shutdown."""
+    with _lock:
+        llms = list(_clients.values())
+        http_clients = list(_http_clients)
+        _clients.clear()
+        _http_clients.clear()
+
+    for client in http_clients:
+        await _close_quietly(client)
+
+    # SDK clients created lazily inside the LangChain wrappers (Anthropic, Ollama)
+    for llm in llms:
+        private = getattr(llm, "__pydantic_private__", None) or {}
+        for attr in ("_client", "_async_client"):
+            sdk_client = llm.__dict__.get(attr) or private.get(attr)
+            if sdk_client is not None:
+                # Both SDKs keep their httpx client in `_client`
+                await _close_quietly(getattr(sdk_client, "_client", sdk_client))
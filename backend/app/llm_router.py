@@ -0,0 +1,383 @@
+import asyncio
+import inspect
+import os
+import time
+from collections import deque
+from typing import Callable, Optional
+
+from app.llm_factory import get_llm, PROVIDER_MODELS
+from app.redis_client import redis_client
+
+# Failover order after the requested provider ("" = no failover)
+LLM_CASCADE = [p.strip() for p in os.getenv("LLM_CASCADE", "claude,deepseek,qwen").split(",") if p.strip() in PROVIDER_MODELS]
+# Cheaper model tried first by analyzer_node; escalates to the requested provider if its JSON fails validation
+ANALYZER_CHEAP_PROVIDER = os.getenv("ANALYZER_CHEAP_PROVIDER", "")
+
+# Hedging (opt-in): "node:mode:category" entries, * = any, missing parts = any.
+# Example: "writer:*:CRISIS,analyzer:pr" - the analyzer runs before the category is known.
+LLM_HEDGE_POLICY = [tuple((part.strip() or "*") for part in (entry.split(":") + ["*", "*"])[:3])
+                    for entry in os.getenv("LLM_HEDGE_POLICY", "").split(",") if entry.strip()]
+LLM_HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "10"))  # seconds, until p90 is known
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1"))
+LLM_HEDGE_MIN_SAMPLES = 10  # successful calls needed before p90 is trusted
+LLM_HEDGE_BUDGET = int(os.getenv("LLM_HEDGE_BUDGET", "50"))  # hedged calls per window, all processes
+LLM_HEDGE_BUDGET_WINDOW = int(os.getenv("LLM_HEDGE_BUDGET_WINDOW", "3600"))  # seconds
+HEDGE_STATS_KEY = "llm_hedge:stats"  # HASH: fired / wins / primary_wins / over_budget
+
+# Providers whose clients support native structured output (tool calling) for a pydantic schema
+STRUCTURED_OUTPUT_PROVIDERS = [p.strip() for p in os.getenv("STRUCTURED_OUTPUT_PROVIDERS", "claude,qwen,deepseek").split(",") if p.strip()]
+
+# Circuit breaker (per process): opens when the error rate over the last window is too high
+LLM_BREAKER_WINDOW = int(os.getenv("LLM_BREAKER_WINDOW", "20"))  # last N calls per provider
+LLM_BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "5"))
+LLM_BREAKER_ERROR_RATE = float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "60"))  # seconds before a trial call
+LLM_LATENCY_WINDOW = 100  # successful calls kept for percentiles
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+def get_llm_stats_key(provider: str) -> str:
+    return f"llm_stats:{provider}"  # HASH: calls / errors / parse_errors / fallbacks / total_ms
+
+class ProviderHealth:
+    """Rolling latency, error and parse-failure stats plus breaker state for one provider."""
+
+    def __init__(self):
+        self.outcomes = deque(maxlen=LLM_BREAKER_WINDOW)  # True = call succeeded
+        self.parse_outcomes = deque(maxlen=LLM_BREAKER_WINDOW)  # True = output validated
+        self.latencies = deque(maxlen=LLM_LATENCY_WINDOW)  # ms of successful calls
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probing = False
+
+    def allow(self) -> bool:
+        if self.state == OPEN and time.monotonic() - self.opened_at >= LLM_BREAKER_COOLDOWN:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            # One trial call at a time decides whether the provider is back
+            if self.probing:
+                return False
+            self.probing = True
+            return True
+        return self.state == CLOSED
+
+    def record(self, ok: bool, latency_ms: float):
+        self.outcomes.append(ok)
+        if ok:
+            self.latencies.append(latency_ms)
+
+        if self.state == HALF_OPEN:
+            self.probing = False
+            if ok:
+                self.state = CLOSED
+                self.outcomes.clear()
+            else:
+                self._open()
+        elif self.state == CLOSED and not ok and len(self.outcomes) >= LLM_BREAKER_MIN_CALLS:
+            if self.error_rate() >= LLM_BREAKER_ERROR_RATE:
+                self._open()
+
+    def record_parse(self, ok: bool):
+        self.parse_outcomes.append(ok)
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def snapshot(self) -> dict:
+        p50, p90 = self.percentile(0.5), self.percentile(0.9)
+        return {
+            "state": self.state,
+            "calls": len(self.outcomes),
+            "error_rate": round(self.error_rate(), 4),
+            "parse_failure_rate": round(self.parse_outcomes.count(False) / len(self.parse_outcomes), 4) if self.parse_outcomes else 0.0,
+            "p50_ms": round(p50, 1) if p50 is not None else None,
+            "p90_ms": round(p90, 1) if p90 is not None else None,
+        }
+
+_health = {provider: ProviderHealth() for provider in PROVIDER_MODELS}  # per process
+
+def get_health(provider: str) -> ProviderHealth:
+    return _health[provider]
+
+class AllProvidersFailed(Exception):
+    """Every provider in the chain failed, was unavailable or returned invalid output."""
+
+class ProviderFailed(Exception):
+    """One provider call failed or returned invalid output (the chain moves on)."""
+
+def provider_chain(model_provider: str, cheap_first: Optional[str] = None) -> list:
+    """Requested provider, then the cascade. cheap_first (if set) goes in front of everything."""
+    requested = model_provider if model_provider in PROVIDER_MODELS else "claude"
+    chain = [cheap_first] if cheap_first in PROVIDER_MODELS else []
+    chain += [requested] + LLM_CASCADE
+    return list(dict.fromkeys(chain))
+
+async def _record(provider: str, ok: bool, latency_ms: float, parse_ok: Optional[bool] = None, fallback: bool = False):
+    health = _health[provider]
+    health.record(ok, latency_ms)
+    if parse_ok is not None:
+        health.record_parse(parse_ok)
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            key = get_llm_stats_key(provider)
+            pipe.hincrby(key, "calls", 1)
+            pipe.hincrbyfloat(key, "total_ms", round(latency_ms, 1))
+            if not ok:
+                pipe.hincrby(key, "errors", 1)
+            if parse_ok is False:
+                pipe.hincrby(key, "parse_errors", 1)
+            if fallback:
+                pipe.hincrby(key, "fallbacks", 1)
+            await pipe.execute()
+    except Exception as e:
+        print(f"LLM Stats Error: {e}")
+
+def should_hedge(node: str, mode: Optional[str] = None, category: Optional[str] = None) -> bool:
+    """True if LLM_HEDGE_POLICY has an entry matching this node, generation mode and news category."""
+    values = (node, mode or "pr", (category or "").upper())
+    for entry in LLM_HEDGE_POLICY:
+        if all(expected == "*" or expected.lower() == value.lower() for expected, value in zip(entry, values)):
+            return True
+    return False
+
+def hedge_delay(provider: str) -> float:
+    """How long to wait for the primary before hedging: its observed p90 latency."""
+    health = _health[provider]
+    p90 = health.percentile(0.9)
+    if p90 is None or len(health.latencies) < LLM_HEDGE_MIN_SAMPLES:
+        return LLM_HEDGE_DEFAULT_DELAY
+    return max(LLM_HEDGE_MIN_DELAY, p90 / 1000)
+
+async def reserve_hedge() -> bool:
+    """Takes one hedge from the shared budget of the current window. False once it's spent."""
+    key = f"llm_hedge:budget:{int(time.time() // LLM_HEDGE_BUDGET_WINDOW)}"
+    try:
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.incr(key)
+            pipe.expire(key, LLM_HEDGE_BUDGET_WINDOW)
+            used, _ = await pipe.execute()
+    except Exception as e:
+        # No shared accounting, no hedge
+        print(f"LLM Hedge Budget Error: {e}")
+        return False
+    if used > LLM_HEDGE_BUDGET:
+        await _record_hedge("over_budget")
+        return False
+    return True
+
+async def _record_hedge(field: str):
+    try:
+        await redis_client.hincrby(HEDGE_STATS_KEY, field, 1)
+    except Exception as e:
+        print(f"LLM Stats Error: {e}")
+
+class RoutedLLM:
+    """
+    Drop-in for a chat model's ainvoke/astream that walks a provider chain:
+    providers with an open breaker or no credentials are skipped, errors fail over to the next one.
+    """
+
+    def __init__(self, providers: list, temperature: float = 0.7, hedge: bool = False, structured=None):
+        self.providers = providers
+        self.temperature = temperature
+        self.hedge = hedge
+        self.structured = structured  # pydantic schema: responses become {"raw", "parsed", "parsing_error"}
+
+    def _candidates(self):
+        for index, provider in enumerate(self.providers):
+            if not _health[provider].allow():
+                print(f"LLM Router: {provider} circuit open, skipping")
+                continue
+            try:
+                llm = get_llm(provider, self.temperature)
+            except ValueError as e:
+                # Not configured (missing API key): not the provider's fault, breaker untouched
+                _health[provider].probing = False
+                print(f"LLM Router: {provider} unavailable: {e}")
+                continue
+            yield index, provider, llm
+
+    async def _attempt(self, index: int, provider: str, llm, messages, validate: Optional[Callable]):
+        """One provider call: records stats, returns (result, provider) or raises ProviderFailed."""
+        if self.structured is not None and provider in STRUCTURED_OUTPUT_PROVIDERS:
+            llm = llm.with_structured_output(self.structured, include_raw=True)
+        start = time.monotonic()
+        recorded = False
+        try:
+            try:
+                response = await llm.ainvoke(messages)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                recorded = True
+                await _record(provider, False, (time.monotonic() - start) * 1000, fallback=index > 0)
+                print(f"LLM Router: {provider} failed: {e}")
+                raise ProviderFailed(f"{provider}: {e}")
+
+            latency_ms = (time.monotonic() - start) * 1000
+            if validate is None:
+                recorded = True
+                await _record(provider, True, latency_ms, fallback=index > 0)
+                return response, provider
+            try:
+                result = validate(response)
+                if inspect.isawaitable(result):
+                    result = await result
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                recorded = True
+                await _record(provider, True, latency_ms, parse_ok=False, fallback=index > 0)
+                print(f"LLM Router: {provider} returned invalid output: {e}")
+                raise ProviderFailed(f"{provider}: invalid output: {e}")
+            recorded = True
+            await _record(provider, True, latency_ms, parse_ok=True, fallback=index > 0)
+            return result, provider
+        finally:
+            if not recorded:
+                # Lost a hedge race or the caller went away (also mid-validation):
+                # neither counts against the provider, but a half-open trial slot must be released
+                _health[provider].probing = False
+
+    async def ainvoke_validated(self, messages, validate: Optional[Callable] = None):
+        """
+        Returns (result, provider). validate(response) (sync or async) parses the response and raises if it is unusable;
+        the next provider is tried in that case. Without validate the result is the raw response.
+        With hedging on, a second provider is started if the first hasn't answered by its p90
+        latency, and the first valid result wins.
+        """
+        errors = []
+        candidates = self._candidates()
+        held = None  # candidate pulled for a hedge that the budget refused; tried next in order
+        try:
+            while True:
+                candidate, held = held or next(candidates, None), None
+                if candidate is None:
+                    break
+                index, provider, llm = candidate
+                tasks = {asyncio.ensure_future(self._attempt(index, provider, llm, messages, validate))}
+                hedge_task = None
+                try:
+                    if self.hedge:
+                        delay = hedge_delay(provider)
+                        done, _ = await asyncio.wait(tasks, timeout=delay)
+                        backup = None if done else next(candidates, None)
+                        if backup is not None:
+                            if await reserve_hedge():
+                                print(f"LLM Router: {provider} slower than {delay:.2f}s, hedging with {backup[1]}")
+                                hedge_task = asyncio.ensure_future(self._attempt(*backup, messages, validate))
+                                tasks.add(hedge_task)
+                                await _record_hedge("fired")
+                            else:
+                                held = backup
+
+                    pending = tasks
+                    while pending:
+                        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                        for task in done:
+                            error = task.exception()
+                            if error is None:
+                                if hedge_task is not None:
+                                    await _record_hedge("wins" if task is hedge_task else "primary_wins")
+                                return task.result()
+                            if not isinstance(error, ProviderFailed):
+                                raise error
+                            errors.append(str(error))
+                finally:
+                    for task in tasks:
+                        task.cancel()
+        finally:
+            if held is not None:
+                # Never called: release its half-open trial slot
+                _health[held[1]].probing = False
+
+        raise AllProvidersFailed("; ".join(errors) or f"No available provider in {self.providers}")
+
+    async def ainvoke(self, messages):
+        response, _ = await self.ainvoke_validated(messages)
+        return response
+
+    async def astream(self, messages):
+        """Fails over only until the first chunk: once output has been streamed it cannot be retracted."""
+        errors = []
+        for index, provider, llm in self._candidates():
+            start = time.monotonic()
+            started = recorded = False
+            try:
+                try:
+                    async for chunk in llm.astream(messages):
+                        started = True
+                        yield chunk
+                except Exception as e:
+                    recorded = True
+                    await _record(provider, False, (time.monotonic() - start) * 1000, fallback=index > 0)
+                    if started:
+                        raise
+                    print(f"LLM Router: {provider} failed: {e}")
+                    errors.append(f"{provider}: {e}")
+                    continue
+                recorded = True
+                await _record(provider, True, (time.monotonic() - start) * 1000, fallback=index > 0)
+                return
+            finally:
+                if not recorded:
+                    # Cancelled, or the consumer closed the generator (client disconnect):
+                    # doesn't count against the provider, but its half-open trial slot must be released
+                    _health[provider].probing = False
+
+        raise AllProvidersFailed("; ".join(errors) or f"No available provider in {self.providers}")
+
+def get_routed_llm(model_provider: str = "claude", temperature: float = 0.7, cheap_first: Optional[str] = None,
+                   hedge: bool = False, structured=None) -> RoutedLLM:
+    return RoutedLLM(provider_chain(model_provider, cheap_first), temperature, hedge, structured)
+
+async def get_llm_stats() -> dict:
+    """Per provider: breaker state and rolling stats of this process, plus totals across processes."""
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for provider in PROVIDER_MODELS:
+                pipe.hgetall(get_llm_stats_key(provider))
+            totals = await pipe.execute()
+    except Exception as e:
+        print(f"LLM Stats Error: {e}")
+        totals = [{} for _ in PROVIDER_MODELS]
+
+    try:
+        hedges = await redis_client.hgetall(HEDGE_STATS_KEY)
+    except Exception as e:
+        print(f"LLM Stats Error: {e}")
+        hedges = {}
+
+    stats = {}
+    for provider, data in zip(PROVIDER_MODELS, totals):
+        snapshot = _health[provider].snapshot()
+        calls = int(data.get("calls", 0))
+        snapshot["total"] = {
+            "calls": calls,
+            "errors": int(data.get("errors", 0)),
+            "parse_errors": int(data.get("parse_errors", 0)),
+            "fallbacks": int(data.get("fallbacks", 0)),
+            "avg_ms": round(float(data.get("total_ms", 0)) / calls, 1) if calls else 0.0,
+        }
+        stats[provider] = snapshot
+    return {
+        "cascade": LLM_CASCADE,
+        "analyzer_cheap_provider": ANALYZER_CHEAP_PROVIDER or None,
+        "providers": stats,
+        "hedging": {
+            "policy": [":".join(entry) for entry in LLM_HEDGE_POLICY],
+            "budget": LLM_HEDGE_BUDGET,
+            "budget_window": LLM_HEDGE_BUDGET_WINDOW,
+            **{field: int(hedges.get(field, 0)) for field in ("fired", "wins", "primary_wins", "over_budget")},
+        },
+    }
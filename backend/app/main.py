@@ -1,21 +1,19 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from app.models import NewsInput, MediaPlan, NewsAnalysis, RegenerateRequest, GeneratedPost, Platform, BrandProfile
-from app.agents.graph import app as agent_app
+from app.models import NewsInput, MediaPlan, NewsAnalysis, RegenerateRequest, GeneratedPost, Platform, BrandProfile, BatchGenerateRequest
+import asyncio
 import uuid
 
 from app.database import engine, Base
-from app.auth.router import router as auth_router, get_current_user
+from app.auth.router import router as auth_router, get_current_user, get_current_user_from_query
 from app.auth.models import User
-from app.auth.models import User
-from fastapi import Depends
-import redis
+from app.history_index import PlanIndexEntry, PlanIndexBackfill  # registers the plan_index tables
+from fastapi import Depends, Request, WebSocket
+from fastapi.responses import StreamingResponse
 import json
 import os
-
-# Redis connection
-redis_client = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://redis:6379/0"), decode_responses=True)
+from app.redis_client import redis_client
 
 # Create Tables
 Base.metadata.create_all(bind=engine)
@@ -24,12 +22,28 @@ app = FastAPI()
 
 app.include_router(auth_router)
 
+@app.on_event("shutdown")
+async def shutdown():
+    from app.llm_factory import close_llm_clients
+    from app.rag.store import rag_store
+    from app.database import async_engine
+    from app.redis_client import close_redis
+    from app.utils.http_client import close_scrape_client
+    from app.progress import progress_hub
+    await progress_hub.close()
+    await rag_store.flush()
+    await close_llm_clients()
+    await close_scrape_client()
+    await async_engine.dispose()
+    await close_redis()
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000", "http://127.0.0.1:3000"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 @app.get("/")
@@ -37,108 +51,59 @@ def read_root():
     return {"Hello": "World", "Service": "AI-Newsmaker Backend"}
 
 @app.get("/history")
-async def get_history(user: User = Depends(get_current_user)):
-    """Returns recent generations from MinIO for the current user."""
-    from app.storage import storage
-    return storage.list_generations(user_id=user.id, limit=12)
+async def get_history(response: Response, limit: int = 12, cursor: str | None = None, user: User = Depends(get_current_user)):
+    """
+    Returns a lightweight projection of recent generations for the current user.
+    Pagination: pass the X-Next-Cursor response header back as ?cursor=.
+    """
+    from app.history_index import list_plan_index, ensure_backfilled
+    
+    limit = max(1, min(limit, 100))
+    # Plans saved before the index existed: indexed from MinIO once per user
+    await ensure_backfilled(user.id)
+    try:
+        items, next_cursor = await list_plan_index(user.id, limit=limit, cursor=cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+    
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return items
 
 @app.get("/history/{plan_id}")
 async def get_plan(plan_id: str, user: User = Depends(get_current_user)):
     """Returns a specific plan by ID for the current user."""
-    from app.storage import storage
-    data = storage.get_generation(user_id=user.id, plan_id=plan_id)
+    from app.storage import async_storage
+    data = await async_storage.get_generation(user_id=user.id, plan_id=plan_id)
     if not data:
         raise HTTPException(status_code=404, detail="План не найден")
     return data
 
-# Background task for generation
-async def run_generation_task(task_id: str, news: NewsInput, user_id: int):
-    """Background task that runs the actual generation."""
-    from app.task_queue import update_task_status, TaskStatus
-    from app.storage import storage
-    
-    try:
-        update_task_status(task_id, TaskStatus.PROCESSING)
-        
-        # Run the LangGraph workflow with user context and mode
-        initial_state = {
-            "input": news, 
-            "user_id": user_id, 
-            "mode": news.mode or "pr",
-            "target_brand": news.target_brand,
-            "errors": []
-        }
-        result = await agent_app.ainvoke(initial_state)
-        
-        if result.get("errors"):
-            update_task_status(task_id, TaskStatus.ERROR, error=str(result['errors']))
-            return
-            
-        # Construct response
-        final_input = result.get("input", news)
-        
-        plan = MediaPlan(
-            id=task_id,  # Use task_id as plan_id
-            original_news=final_input,
-            analysis=result["analysis"],
-            posts=result["posts"]
-        )
-        
-        # Save to MinIO History (User specific)
-        storage.save_generation(user_id, plan.id, plan.dict())
-        
-        # Update task with result
-        update_task_status(task_id, TaskStatus.READY, data=plan.dict())
-        
-        # Get Telegram Chat ID
-        telegram_chat_id = None
-        try:
-            from app.database import SessionLocal
-            from app.auth.models import User
-            with SessionLocal() as db:
-                user_obj = db.query(User).filter(User.id == user_id).first()
-                if user_obj:
-                    telegram_chat_id = user_obj.telegram_chat_id
-        except Exception as e:
-            print(f"Error fetching User for notification: {e}")
+@app.get("/cache/stats")
+async def cache_stats(user: User = Depends(get_current_user)):
+    """Returns cache hit/miss counters."""
+    from app.analysis_cache import get_cache_stats
+    from app.utils.scrape_cache import get_scrape_cache_stats
+    from app.rag.cache import get_rag_cache_stats
+    from app.agents.monitoring import get_search_cache_stats
+    return {
+        "analysis": await get_cache_stats(),
+        "scrape": await get_scrape_cache_stats(),
+        "rag": await get_rag_cache_stats(),
+        "search": await get_search_cache_stats()
+    }
 
-        # Publish Notification to Redis
-        try:
-            # Find the best post (e.g. Telegram or first available)
-            best_post = next((p for p in plan.posts if p.platform == "telegram"), plan.posts[0] if plan.posts else None)
-            post_content = best_post.content if best_post else "Нет сгенерированного поста."
-
-            redis_client.publish("task_updates", json.dumps({
-                "type": "task_completed",
-                "task_id": task_id,
-                "user_id": user_id,
-                "telegram_chat_id": telegram_chat_id,
-                "summary": plan.analysis.summary,
-                "score": plan.analysis.relevance_score,
-                "verdict": plan.analysis.pr_verdict,
-                "post_content": post_content,
-                "status": "ready"
-            }))
-        except Exception as e:
-            print(f"Redis Publish Error: {e}")
-        
-    except Exception as e:
-        print(f"Generation Error: {e}")
-        import traceback
-        traceback.print_exc()
-        update_task_status(task_id, TaskStatus.ERROR, error=str(e))
-        
-        # Publish Error Notification
-        try:
-            redis_client.publish("task_updates", json.dumps({
-                "type": "task_error",
-                "task_id": task_id,
-                "user_id": user_id,
-                "telegram_chat_id": telegram_chat_id if 'telegram_chat_id' in locals() else None,
-                "error": str(e)
-            }))
-        except:
-            pass
+@app.get("/scrape/stats")
+async def scrape_stats(user: User = Depends(get_current_user)):
+    """Per-host scraper stats: requests, errors, retries, latency."""
+    from app.utils.http_client import get_scrape_host_stats
+    return await get_scrape_host_stats()
+
+@app.get("/llm/stats")
+async def llm_stats(user: User = Depends(get_current_user)):
+    """Per-provider latency percentiles, error/parse-failure rates and circuit breaker state."""
+    from app.llm_router import get_llm_stats
+    return await get_llm_stats()
 
 class BotGenerateRequest(BaseModel):
     url: str
@@ -147,27 +112,25 @@ class BotGenerateRequest(BaseModel):
     mode: str = "pr"
 
 @app.post("/bot/generate")
-async def bot_generate(req: BotGenerateRequest, background_tasks: BackgroundTasks):
+async def bot_generate(req: BotGenerateRequest):
     """
     Internal endpoint for Bot to trigger generation.
     """
-    from app.database import SessionLocal
-    from app.task_queue import save_task, can_start_task, TaskStatus
+    from app.database import AsyncSessionLocal
+    from sqlalchemy import select
+    from app.task_queue import reserve_task, enqueue_generation
     
     # 1. Find User by Telegram ID
-    with SessionLocal() as db:
-        user = db.query(User).filter(User.telegram_chat_id == req.telegram_chat_id).first()
+    async with AsyncSessionLocal() as db:
+        user = (await db.execute(select(User).where(User.telegram_chat_id == req.telegram_chat_id))).scalars().first()
         if not user:
             raise HTTPException(status_code=404, detail="User not linked. Please link account first.")
         user_id = user.id
     
-    # Check limits
-    if not can_start_task(user_id):
-        raise HTTPException(status_code=429, detail="Максимум 3 активных генерации. Подождите.")
-
-    # 2. Create Task
+    # 2. Create Task (atomically checks the active-task limit)
     task_id = str(uuid.uuid4())
-    save_task(task_id, user_id, TaskStatus.PENDING)
+    if not await reserve_task(task_id, user_id):
+        raise HTTPException(status_code=429, detail="Максимум 3 активных генерации. Подождите.")
     
     # 3. Create Input
     # Use params from request
@@ -178,26 +141,23 @@ async def bot_generate(req: BotGenerateRequest, background_tasks: BackgroundTask
         brand_profile=BrandProfile(**user.brand_profile) if user.brand_profile else None
     )
     
-    # 4. Run
-    background_tasks.add_task(run_generation_task, task_id, news_input, user_id)
+    # 4. Queue for workers
+    await enqueue_generation(task_id, news_input, user_id)
     
     return {"task_id": task_id, "status": "pending"}
 
 @app.post("/generate")
-async def generate_plan(news: NewsInput, background_tasks: BackgroundTasks, user: User = Depends(get_current_user)):
+async def generate_plan(news: NewsInput, user: User = Depends(get_current_user)):
     """
     Starts async generation. Returns task ID immediately.
     Poll /task/{id}/status for updates.
     """
-    from app.task_queue import save_task, can_start_task, TaskStatus
-    
-    # Check if user can start new task
-    if not can_start_task(user.id):
-        raise HTTPException(status_code=429, detail="Максимум 3 активных генерации. Подождите завершения.")
+    from app.task_queue import reserve_task, enqueue_generation
     
-    # Create task
+    # Create task if the user has a free slot (check + reserve in one atomic step)
     task_id = str(uuid.uuid4())
-    save_task(task_id, user.id, TaskStatus.PENDING)
+    if not await reserve_task(task_id, user.id):
+        raise HTTPException(status_code=429, detail="Максимум 3 активных генерации. Подождите завершения.")
     
     # Инжектируем профиль бренда из БД (фронтенд его не передаёт)
     if user.brand_profile:
@@ -206,17 +166,57 @@ async def generate_plan(news: NewsInput, background_tasks: BackgroundTasks, user
         except Exception:
             pass
     
-    # Queue background task
-    background_tasks.add_task(run_generation_task, task_id, news, user.id)
+    # Queue for workers (python -m app.worker)
+    await enqueue_generation(task_id, news, user.id)
     
     return {"id": task_id, "status": "pending"}
 
+@app.post("/generate/batch")
+async def generate_batch(req: BatchGenerateRequest, user: User = Depends(get_current_user)):
+    """
+    Starts generation for many news items at once. Identical URLs/texts are generated once.
+    Items run BATCH_CONCURRENCY at a time per batch and BATCH_USER_CONCURRENCY per user
+    across all their batches (not limited by the 3 active /generate tasks).
+    Poll /generate/batch/{id} for aggregate progress and per-item results.
+    """
+    from app.batches import create_batch, BATCH_MAX_ITEMS
+    
+    if not req.items:
+        raise HTTPException(status_code=400, detail="Список новостей пуст")
+    if len(req.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Максимум {BATCH_MAX_ITEMS} новостей в одном пакете")
+    if any(not (news.url or news.text) for news in req.items):
+        raise HTTPException(status_code=400, detail="Каждый элемент должен содержать url или text")
+    
+    # Инжектируем профиль бренда из БД, как в /generate
+    if user.brand_profile:
+        try:
+            profile = BrandProfile(**user.brand_profile) if isinstance(user.brand_profile, dict) else user.brand_profile
+            for news in req.items:
+                news.brand_profile = profile
+        except Exception:
+            pass
+    
+    return await create_batch(user.id, req.items)
+
+@app.get("/generate/batch/{batch_id}")
+async def get_batch_status(batch_id: str, user: User = Depends(get_current_user)):
+    """Aggregate progress (total/ready/error/processing/queued) and per-item status and results."""
+    from app.batches import get_batch
+    
+    batch = await get_batch(batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Пакет не найден")
+    if batch["user_id"] != user.id:
+        raise HTTPException(status_code=403, detail="Нет доступа")
+    return batch
+
 @app.get("/task/{task_id}/status")
 async def get_task_status(task_id: str, user: User = Depends(get_current_user)):
     """Get status of a generation task."""
     from app.task_queue import get_task
     
-    task = get_task(task_id)
+    task = await get_task(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Задача не найдена")
     
@@ -226,156 +226,269 @@ async def get_task_status(task_id: str, user: User = Depends(get_current_user)):
     
     return task
 
-@app.post("/regenerate", response_model=GeneratedPost)
-async def regenerate_post(request: RegenerateRequest, user: User = Depends(get_current_user)):
+@app.get("/task/{task_id}/events")
+async def task_events(task_id: str, request: Request, user: User = Depends(get_current_user_from_query)):
     """
-    Regenerates a single post for a specific platform.
+    Server-sent events with per-node progress (processing, node, platform, retry, ready, error).
+    Replaces polling /task/{id}/status. Resumes after Last-Event-ID on reconnect.
     """
-    from app.agents.writer import get_llm
-    from langchain_core.messages import SystemMessage, HumanMessage
-    from app.models import GeneratedPost
-    import urllib.parse
+    from app.task_queue import get_task
+    from app.progress import stream_progress, format_sse
+    
+    task = await get_task(task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    if task.get("user_id") != user.id:
+        raise HTTPException(status_code=403, detail="Нет доступа")
+    
+    try:
+        last_seq = int(request.headers.get("last-event-id", 0))
+    except ValueError:
+        last_seq = 0
+    
+    async def event_stream():
+        async for event in stream_progress(task_id, last_seq=last_seq):
+            if await request.is_disconnected():
+                break
+            yield format_sse(event)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
+@app.websocket("/task/{task_id}/ws")
+async def task_events_ws(websocket: WebSocket, task_id: str, token: str | None = None):
+    """WebSocket variant of /task/{task_id}/events (auth via ?token=)."""
+    from app.auth.router import get_user_from_token
+    from app.task_queue import get_task
+    from app.progress import stream_progress
+    
     try:
-        # Use the same model that was used for original generation
-        model_provider = request.original_news.model_provider if request.original_news else "claude"
-        llm = get_llm(model_provider)
-        
-        # Reconstruct context (simplified for single post)
-        brand_name = request.original_news.brand_profile.name if request.original_news.brand_profile else "Brand"
-        
-        # Determine style guide and structure based on platform
-        if request.platform == Platform.EMAIL:
-            style_guide = """
-            ФОРМАТ СЛУЖЕБНОЙ ЗАПИСКИ.
-            Структура:
-            Тема: [Четкая, побуждающая к действию тема]
-            Кому: [Целевые стейкхолдеры, например, Маркетинг, CEO]
-            Рекомендация: [Конкретный совет на основе анализа]
-            
-            Текст:
-            [Краткий анализ ситуации и обоснование позиции. Официально, но прямо.]
-            """
-        elif request.platform == Platform.PRESS_RELEASE:
-            style_guide = """
-            ФОРМАТ ОФИЦИАЛЬНОГО ПРЕСС-РЕЛИЗА.
-            Структура:
-            ДЛЯ НЕМЕДЛЕННОГО РАСПРОСТРАНЕНИЯ
-            
-            [ЗАГОЛОВОК: Прописными, Впечатляющий]
-            
-            [Город, Дата] — [Лид-абзац: Кто, что, когда, где, почему]
-            
-            [Основной текст: Детали, контекст, официальные цитаты]
-            
-            [О компании (справка)]
-            
-            Контакты для СМИ:
-            [Имя/Email]
-            """
-            style_guide = """
-            Telegram Channel Style.
-            - Use Markdown (*bold*, _italic_) for emphasis.
-            - Use Emojis 🚀.
-            - Short paragraphs.
-            - Call to Action (CTA) at the end.
-            """
-        elif request.platform == Platform.IMAGE:
-             # Logic for Image Regeneration
-             prompt = f"""
-             YOU ARE AN AI ART DIRECTOR.
-             TASK: Create a NEW, BETTER stable diffusion prompt for an image representing this news.
-             
-             News Analysis:
-             {request.analysis.summary}
-             
-             Visual Analysis:
-             Topics: {request.analysis.topics}
-             Sentiment: {request.analysis.sentiment}
-             
-             REQUIREMENTS:
-             - English ONLY.
-             - Descriptive, visual, artistic.
-             - No text in image.
-             - Modern, premium, cinematic lighting.
-             
-             OUTPUT: Just the prompt string.
-             """
-             
-             response = await llm.ainvoke([HumanMessage(content=prompt)])
-             image_prompt = response.content.strip()
-             
-             encoded_prompt = urllib.parse.quote(image_prompt)
-             image_url = f"https://image.pollinations.ai/prompt/{encoded_prompt}?nologo=true"
-             
-             return GeneratedPost(
-                platform=Platform.IMAGE,
-                content="Image Updated",
-                image_prompt=image_prompt,
-                image_url=image_url,
-                status="draft"
-             )
-             
-        else:
-            style_guide = "Engaging social media style. Emojis allowed. NO Markdown headers (like ##). Ready to publish."
+        user = await get_user_from_token(token)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+    
+    task = await get_task(task_id)
+    if not task or task.get("user_id") != user.id:
+        await websocket.close(code=1008)
+        return
+    
+    await websocket.accept()
+    
+    async def send_events():
+        async for event in stream_progress(task_id):
+            # Keep-alives also surface a dead client: sending to it fails
+            await websocket.send_json(event if event is not None else {"event": "keep-alive"})
+        await websocket.close()
+    
+    async def wait_disconnect():
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    
+    # Whichever finishes first ends the other, so a gone client doesn't hold the stream until the task ends
+    tasks = [asyncio.create_task(send_events()), asyncio.create_task(wait_disconnect())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
+def _regenerate_messages(request: RegenerateRequest) -> list:
+    """Prompt for regenerating one post. IMAGE asks only for a new image prompt."""
+    from langchain_core.messages import SystemMessage, HumanMessage
+
+    if request.platform == Platform.IMAGE:
         prompt = f"""
-        YOU ARE THE OFFICIAL VOICE OF THE BRAND: {brand_name}.
+        YOU ARE AN AI ART DIRECTOR.
+        TASK: Create a NEW, BETTER stable diffusion prompt for an image representing this news.
         
-        TASK: Rewrite the content for {request.platform.upper()} in RUSSIAN.
+        News Analysis:
+        {request.analysis.summary}
         
-        Analysis:
-        - Summary: {request.analysis.summary}
-        - Facts: {", ".join(request.analysis.facts)}
-        - Sentiment: {request.analysis.sentiment}
-        - PR Verdict: {request.analysis.pr_verdict}
+        Visual Analysis:
+        Topics: {request.analysis.topics}
+        Sentiment: {request.analysis.sentiment}
         
-        Style Guide: 
-        {style_guide}
+        REQUIREMENTS:
+        - English ONLY.
+        - Descriptive, visual, artistic.
+        - No text in image.
+        - Modern, premium, cinematic lighting.
         
-        CRITICAL RULES:
-        1. Write AS {brand_name}.
-        2. Language: RUSSIAN.
-        3. Follow the specific structure for {request.platform.value} defined above.
+        OUTPUT: Just the prompt string.
+        """
+        return [HumanMessage(content=prompt)]
+
+    # Reconstruct context (simplified for single post)
+    brand_name = request.original_news.brand_profile.name if request.original_news.brand_profile else "Brand"
+
+    # Determine style guide and structure based on platform
+    if request.platform == Platform.EMAIL:
+        style_guide = """
+        ФОРМАТ СЛУЖЕБНОЙ ЗАПИСКИ.
+        Структура:
+        Тема: [Четкая, побуждающая к действию тема]
+        Кому: [Целевые стейкхолдеры, например, Маркетинг, CEO]
+        Рекомендация: [Конкретный совет на основе анализа]
         
-        At the very end, strictly separated by "|||", provide a NEW Image Prompt in English.
+        Текст:
+        [Краткий анализ ситуации и обоснование позиции. Официально, но прямо.]
         """
+    elif request.platform == Platform.PRESS_RELEASE:
+        style_guide = """
+        ФОРМАТ ОФИЦИАЛЬНОГО ПРЕСС-РЕЛИЗА.
+        Структура:
+        ДЛЯ НЕМЕДЛЕННОГО РАСПРОСТРАНЕНИЯ
+        
+        [ЗАГОЛОВОК: Прописными, Впечатляющий]
         
-        messages = [
-            SystemMessage(content=f"You are the Head of Communications for {brand_name}."),
-            HumanMessage(content=prompt)
-        ]
+        [Город, Дата] — [Лид-абзац: Кто, что, когда, где, почему]
         
-        response = await llm.ainvoke(messages)
+        [Основной текст: Детали, контекст, официальные цитаты]
         
-        # Parse
-        full_content = response.content
+        [О компании (справка)]
+        
+        Контакты для СМИ:
+        [Имя/Email]
+        """
+        style_guide = """
+        Telegram Channel Style.
+        - Use Markdown (*bold*, _italic_) for emphasis.
+        - Use Emojis 🚀.
+        - Short paragraphs.
+        - Call to Action (CTA) at the end.
+        """
+    else:
+        style_guide = "Engaging social media style. Emojis allowed. NO Markdown headers (like ##). Ready to publish."
+
+    prompt = f"""
+    YOU ARE THE OFFICIAL VOICE OF THE BRAND: {brand_name}.
+    
+    TASK: Rewrite the content for {request.platform.upper()} in RUSSIAN.
+    
+    Analysis:
+    - Summary: {request.analysis.summary}
+    - Facts: {", ".join(request.analysis.facts)}
+    - Sentiment: {request.analysis.sentiment}
+    - PR Verdict: {request.analysis.pr_verdict}
+    
+    Style Guide: 
+    {style_guide}
+    
+    CRITICAL RULES:
+    1. Write AS {brand_name}.
+    2. Language: RUSSIAN.
+    3. Follow the specific structure for {request.platform.value} defined above.
+    
+    At the very end, strictly separated by "|||", provide a NEW Image Prompt in English.
+    """
+
+    return [
+        SystemMessage(content=f"You are the Head of Communications for {brand_name}."),
+        HumanMessage(content=prompt)
+    ]
+
+def _regenerated_post(platform: Platform, full_content: str) -> GeneratedPost:
+    """Builds the GeneratedPost from the full completion ("post ||| image prompt")."""
+    import urllib.parse
+
+    if platform == Platform.IMAGE:
+        content = "Image Updated"
+        image_prompt = full_content.strip()
+    else:
         content = full_content
         image_prompt = "Abstract modern technology"
-        
+
         if "|||" in full_content:
             parts = full_content.split("|||")
             content = parts[0].strip()
             if len(parts) > 1:
                 image_prompt = parts[1].strip()
-                
-        # Generate Image URL
-        encoded_prompt = urllib.parse.quote(image_prompt)
-        image_url = f"https://image.pollinations.ai/prompt/{encoded_prompt}?nologo=true"
-        
-        return GeneratedPost(
-            platform=request.platform,
-            content=content,
-            image_prompt=image_prompt,
-            image_url=image_url,
-            status="draft"
-        )
+
+    # Generate Image URL
+    encoded_prompt = urllib.parse.quote(image_prompt)
+    image_url = f"https://image.pollinations.ai/prompt/{encoded_prompt}?nologo=true"
+
+    return GeneratedPost(
+        platform=platform,
+        content=content,
+        image_prompt=image_prompt,
+        image_url=image_url,
+        status="draft"
+    )
+
+@app.post("/regenerate", response_model=GeneratedPost)
+async def regenerate_post(request: RegenerateRequest, user: User = Depends(get_current_user)):
+    """
+    Regenerates a single post for a specific platform.
+    """
+    from app.llm_router import get_routed_llm
+
+    try:
+        # Use the same model that was used for original generation
+        model_provider = request.original_news.model_provider if request.original_news else "claude"
+        llm = get_routed_llm(model_provider)
+
+        response = await llm.ainvoke(_regenerate_messages(request))
+        return _regenerated_post(request.platform, response.content)
         
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/regenerate/stream")
+async def regenerate_post_stream(request: RegenerateRequest, http_request: Request, user: User = Depends(get_current_user)):
+    """
+    Streaming variant of /regenerate (text/event-stream).
+    Events: "token" ({"text": ...}) for post text as it arrives (the image prompt after
+    "|||" is not streamed), then "done" with the GeneratedPost, or "error".
+    """
+    from app.llm_router import get_routed_llm
+    from app.progress import format_sse
+    from app.utils.stream_split import SeparatorStream, chunk_text
+
+    model_provider = request.original_news.model_provider if request.original_news else "claude"
+
+    async def event_stream():
+        seq = 0
+
+        def event(name: str, **data) -> str:
+            nonlocal seq
+            seq += 1
+            return format_sse({"event": name, "seq": seq, **data})
+
+        splitter = SeparatorStream("|||")
+        try:
+            llm = get_routed_llm(model_provider)
+            async for chunk in llm.astream(_regenerate_messages(request)):
+                text = splitter.feed(chunk_text(chunk))
+                if text and request.platform != Platform.IMAGE:
+                    yield event("token", text=text)
+                if await http_request.is_disconnected():
+                    return
+            text = splitter.flush()
+            if text and request.platform != Platform.IMAGE:
+                yield event("token", text=text)
+
+            full_content = splitter.content + ("|||" + splitter.tail if splitter.found else "")
+            post = _regenerated_post(request.platform, full_content)
+            yield event("done", post=post.dict())
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            yield event("error", error=str(e))
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/monitor/scan", response_model=list[NewsInput])
 async def scan_news(target_brand: str | None = None, user: User = Depends(get_current_user)):
     """
@@ -412,18 +525,18 @@ async def feedback(plan_id: str, like: bool, user: User = Depends(get_current_us
     """
     Handles user feedback. Updates 'liked' status and promotes to RAG if liked.
     """
-    from app.storage import storage
+    from app.storage import async_storage
     from app.rag.store import rag_store
 
     try:
         # 0. Update 'liked' status in persistence
-        storage.update_generation(user.id, plan_id, {"liked": like})
+        await async_storage.update_generation(user.id, plan_id, {"liked": like})
         
         if not like:
             return {"status": "unliked"}
             
         # 1. Get Data first to know the category
-        data = storage.get_generation(user.id, plan_id)
+        data = await async_storage.get_generation(user.id, plan_id)
         if not data:
              raise HTTPException(status_code=404, detail="Plan not found in history")
 
@@ -431,7 +544,7 @@ async def feedback(plan_id: str, like: bool, user: User = Depends(get_current_us
         category = data['analysis'].get('category', 'ROUTINE')
         
         # 2. Promote in MinIO (Copy from history to rag-knowledge/{category})
-        success = storage.promote_to_rag(user.id, plan_id, category)
+        success = await async_storage.promote_to_rag(user.id, plan_id, category)
         if not success:
             raise HTTPException(status_code=500, detail="Failed to promote in Storage")
             
@@ -453,7 +566,9 @@ async def feedback(plan_id: str, like: bool, user: User = Depends(get_current_us
             "user_id": user.id
         }
         
-        rag_store.add_case(
+        # Durable batched ingest: queued in Redis (raises if that fails), cases liked within
+        # RAG_INGEST_FLUSH_INTERVAL share one upsert, failed upserts are retried by the workers
+        await rag_store.enqueue_case(
             doc_id=plan_id,
             text=news_text,
             metadata=metadata
@@ -490,7 +605,7 @@ async def publish_telegram(req: PublishRequest, user: User = Depends(get_current
     }
     
     try:
-        redis_client.publish("task_updates", json.dumps(message))
+        await redis_client.publish("task_updates", json.dumps(message))
         return {
             "status": "sent",
             "message": "Пост отправлен в Telegram! 📤\n\n💡 Совет: Добавьте бота (@RezonansAI_bot) админом в ваш канал для автоматической публикации."
@@ -47,6 +47,10 @@ class NewsInput(BaseModel):
     brand_profile: Optional[BrandProfile] = None # Context for analysis
     mode: str = Field("pr", description="Режим: blogger или pr")
     target_brand: Optional[str] = Field(None, description="Для блогера: бренд для анализа")
+    use_cache: bool = Field(True, description="Использовать кэш анализа (False = принудительный повторный анализ)")
+
+class BatchGenerateRequest(BaseModel):
+    items: List[NewsInput] = Field(..., description="Новости для генерации (URL или текст); дубликаты обрабатываются один раз")
 
 class MediaPlan(BaseModel):
     id: str
@@ -0,0 +1,152 @@
+# Scheduled brand monitoring: scans every user's BrandProfile.keywords on an interval
+# and queues only mentions that haven't been seen before. Runs inside the worker
+# (python -m app.worker) when MONITOR_ENABLED=true.
+import asyncio
+import hashlib
+import os
+import time
+from typing import List
+
+from app.models import BrandProfile, NewsInput
+from app.redis_client import redis_client
+from app.utils.scrape_cache import canonicalize_url
+
+# Constants
+MONITOR_ENABLED = os.getenv("MONITOR_ENABLED", "false").lower() in ("1", "true", "yes")
+MONITOR_INTERVAL = int(os.getenv("MONITOR_INTERVAL", "1800"))  # seconds between scans
+MONITOR_SEEN_TTL = int(os.getenv("MONITOR_SEEN_TTL", str(7 * 86400)))  # how long a URL counts as seen
+MONITOR_MAX_NEW_PER_SCAN = int(os.getenv("MONITOR_MAX_NEW_PER_SCAN", "5"))  # per brand
+MONITOR_CONCURRENCY = int(os.getenv("MONITOR_CONCURRENCY", "4"))  # brands scanned in parallel
+
+LOCK_KEY = "monitor:lock"  # one replica runs each scan
+STATS_KEY = "monitor:stats"  # HASH: scans / mentions / new
+
+def get_seen_key(user_id: int, brand: BrandProfile) -> str:
+    brand_hash = hashlib.sha1(brand.name.strip().lower().encode("utf-8")).hexdigest()[:12]
+    return f"monitor_seen:{user_id}:{brand_hash}"  # ZSET: canonical URL -> first seen time
+
+def _unique_by_url(mentions: List[NewsInput]) -> dict:
+    unique = {}
+    for mention in mentions:
+        if mention.url:
+            unique.setdefault(canonicalize_url(mention.url), mention)
+    return unique
+
+async def find_unseen_mentions(user_id: int, brand: BrandProfile, mentions: List[NewsInput]) -> List[NewsInput]:
+    """Returns the mentions whose URL isn't in the seen set yet, without marking anything."""
+    key = get_seen_key(user_id, brand)
+    unique = _unique_by_url(mentions)
+    if not unique:
+        return []
+
+    async with redis_client.pipeline(transaction=False) as pipe:
+        # Forget URLs older than the TTL so the set stays small
+        pipe.zremrangebyscore(key, 0, time.time() - MONITOR_SEEN_TTL)
+        pipe.zmscore(key, list(unique))
+        _, scores = await pipe.execute()
+
+    return [mention for mention, score in zip(unique.values(), scores) if score is None]
+
+async def filter_new_mentions(user_id: int, brand: BrandProfile, mentions: List[NewsInput]) -> List[NewsInput]:
+    """
+    Marks mentions as seen and returns the ones that weren't.
+    ZADD NX decides atomically, so concurrent scans never surface the same URL twice.
+    Only pass mentions that will actually be queued: anything marked here is skipped for MONITOR_SEEN_TTL.
+    """
+    key = get_seen_key(user_id, brand)
+    now = time.time()
+    unique = _unique_by_url(mentions)
+    if not unique:
+        return []
+
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for url in unique:
+            pipe.zadd(key, {url: now}, nx=True)
+        pipe.expire(key, MONITOR_SEEN_TTL)
+        results = await pipe.execute()
+
+    added = results[:-1]
+    return [mention for mention, is_new in zip(unique.values(), added) if is_new]
+
+async def unmark_mentions(user_id: int, brand: BrandProfile, mentions: List[NewsInput]):
+    """Reverts filter_new_mentions for mentions that could not be queued, so the next scan retries them."""
+    unique = _unique_by_url(mentions)
+    if unique:
+        await redis_client.zrem(get_seen_key(user_id, brand), *unique)
+
+async def scan_brand(user_id: int, brand: BrandProfile) -> dict:
+    """Searches mentions for one brand and queues the new ones as a generation batch."""
+    from app.agents.monitoring import search_brand_mentions
+    from app.batches import create_batch
+
+    mentions = await search_brand_mentions(brand)
+    # Cap before marking: mentions over the cap stay unseen and are picked up by the next scan
+    unseen = (await find_unseen_mentions(user_id, brand, mentions))[:MONITOR_MAX_NEW_PER_SCAN]
+    new_mentions = await filter_new_mentions(user_id, brand, unseen)
+
+    batch_id = None
+    if new_mentions:
+        try:
+            batch = await create_batch(user_id, new_mentions)
+        except Exception:
+            # Not queued: un-mark so the mentions aren't lost for MONITOR_SEEN_TTL
+            await unmark_mentions(user_id, brand, new_mentions)
+            raise
+        batch_id = batch["batch_id"]
+        print(f"Monitor: user {user_id} / {brand.name}: {len(new_mentions)} new mention(s), batch {batch_id}")
+
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.hincrby(STATS_KEY, "scans", 1)
+        pipe.hincrby(STATS_KEY, "mentions", len(mentions))
+        pipe.hincrby(STATS_KEY, "new", len(new_mentions))
+        await pipe.execute()
+
+    return {"mentions": len(mentions), "new": len(new_mentions), "batch_id": batch_id}
+
+async def load_monitored_brands() -> List[tuple]:
+    """(user_id, BrandProfile) for every user whose profile has keywords."""
+    from sqlalchemy import select
+    from app.database import AsyncSessionLocal
+    from app.auth.models import User
+
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(select(User.id, User.brand_profile).where(User.brand_profile.isnot(None)))).all()
+
+    brands = []
+    for user_id, profile in rows:
+        try:
+            brand = BrandProfile(**profile)
+        except Exception:
+            continue
+        if brand.keywords:
+            brands.append((user_id, brand))
+    return brands
+
+async def run_scan():
+    """One monitoring pass over all users."""
+    brands = await load_monitored_brands()
+    semaphore = asyncio.Semaphore(MONITOR_CONCURRENCY)
+
+    async def scan(user_id: int, brand: BrandProfile):
+        async with semaphore:
+            try:
+                await scan_brand(user_id, brand)
+            except Exception as e:
+                print(f"Monitor Scan Error (user {user_id}): {e}")
+
+    await asyncio.gather(*(scan(user_id, brand) for user_id, brand in brands))
+    print(f"Monitor: scanned {len(brands)} brand(s)")
+
+async def monitoring_loop(stop: asyncio.Event):
+    """Runs a scan every MONITOR_INTERVAL. With several workers, the lock lets only one of them scan."""
+    while not stop.is_set():
+        try:
+            # Held for the whole interval: the next pass (on any replica) starts after it expires
+            if await redis_client.set(LOCK_KEY, os.getpid(), nx=True, ex=MONITOR_INTERVAL):
+                await run_scan()
+        except Exception as e:
+            print(f"Monitor Error: {e}")
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=min(MONITOR_INTERVAL, 60))
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,168 @@
+import asyncio
+import json
+from typing import AsyncIterator, Dict, Optional, Set
+
+from app.redis_client import redis_client
+
+# Constants
+EVENTS_TTL = 3600  # same as TASK_TTL
+TERMINAL_EVENTS = {"ready", "error"}
+KEEPALIVE_INTERVAL = 15  # seconds between SSE keep-alive comments
+SUBSCRIBE_TIMEOUT = 5  # wait for the shared subscription before replaying history
+
+def get_events_key(task_id: str) -> str:
+    return f"task_events:{task_id}"
+
+def get_seq_key(task_id: str) -> str:
+    return f"task_events_seq:{task_id}"
+
+def get_channel(task_id: str) -> str:
+    return f"task_progress:{task_id}"
+
+async def publish_progress(task_id: Optional[str], event: str, **data):
+    """
+    Records a progress event for a task and fans it out over pub/sub.
+    Events are also kept in a list so late subscribers (or another replica) can replay them.
+    """
+    if not task_id:
+        return
+    try:
+        # Monotonic sequence number lets subscribers dedupe replay vs live events
+        seq = await redis_client.incr(get_seq_key(task_id))
+        payload = json.dumps({"event": event, "task_id": task_id, "seq": seq, **data}, ensure_ascii=False, default=str)
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.rpush(get_events_key(task_id), payload)
+            pipe.expire(get_events_key(task_id), EVENTS_TTL)
+            pipe.expire(get_seq_key(task_id), EVENTS_TTL)
+            pipe.publish(get_channel(task_id), payload)
+            await pipe.execute()
+    except Exception as e:
+        print(f"Progress Publish Error: {e}")
+
+class ProgressHub:
+    """
+    One pub/sub connection per process (PSUBSCRIBE task_progress:*), fanned out to local watchers.
+    Open dashboards then don't each hold a connection from the shared Redis pool.
+    """
+    def __init__(self):
+        self._watchers: Dict[str, Set[asyncio.Queue]] = {}
+        self._reader: Optional[asyncio.Task] = None
+        self._ready = asyncio.Event()
+
+    async def subscribe(self, task_id: str) -> asyncio.Queue:
+        """Registers a watcher; returns once the process-wide subscription is live (or after a timeout)."""
+        queue = asyncio.Queue()
+        self._watchers.setdefault(task_id, set()).add(queue)
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.create_task(self._run())
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout=SUBSCRIBE_TIMEOUT)
+        except asyncio.TimeoutError:
+            # Redis unavailable: watchers fall back to polling the task status on keep-alive
+            pass
+        return queue
+
+    def unsubscribe(self, task_id: str, queue: asyncio.Queue):
+        watchers = self._watchers.get(task_id)
+        if watchers is not None:
+            watchers.discard(queue)
+            if not watchers:
+                del self._watchers[task_id]
+
+    async def _run(self):
+        """Reads every progress message and hands it to the watchers of its task; reconnects on errors."""
+        prefix = get_channel("")
+        while True:
+            pubsub = redis_client.pubsub()
+            try:
+                await pubsub.psubscribe(f"{prefix}*")
+                self._ready.set()
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is None:
+                        continue
+                    task_id = message["channel"][len(prefix):]
+                    for queue in self._watchers.get(task_id, ()):
+                        queue.put_nowait(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Progress Hub Error: {e}")
+                await asyncio.sleep(1)
+            finally:
+                self._ready.clear()
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+    async def close(self):
+        if self._reader is not None:
+            self._reader.cancel()
+            try:
+                await self._reader
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._reader = None
+
+progress_hub = ProgressHub()
+
+async def _final_event(task_id: str, seq: int) -> Optional[dict]:
+    """Terminal event built from the task itself (events not recorded, expired or missed)."""
+    from app.task_queue import get_task
+    task = await get_task(task_id)
+    if task and task.get("status") in TERMINAL_EVENTS:
+        return {"event": task["status"], "task_id": task_id, "plan": task.get("data"), "error": task.get("error"), "seq": seq}
+    return None
+
+async def stream_progress(task_id: str, last_seq: int = 0) -> AsyncIterator[Optional[dict]]:
+    """
+    Yields progress events for a task until it reaches a terminal state.
+    Yields None periodically so callers can send keep-alives.
+    """
+    # Subscribe before replaying so nothing published in between is lost
+    queue = await progress_hub.subscribe(task_id)
+    # Concurrent publishers (writer platforms) may land slightly out of order, so dedupe by set
+    seen = set()
+    try:
+        history = [json.loads(raw) for raw in await redis_client.lrange(get_events_key(task_id), 0, -1)]
+        for event in sorted(history, key=lambda e: e.get("seq", 0)):
+            if event.get("seq", 0) <= last_seq:
+                continue
+            seen.add(event["seq"])
+            yield event
+            if event["event"] in TERMINAL_EVENTS:
+                return
+
+        # Task finished before events were recorded (or they expired)
+        final = await _final_event(task_id, max(seen, default=last_seq) + 1)
+        if final:
+            yield final
+            return
+
+        while True:
+            try:
+                raw = await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_INTERVAL)
+            except asyncio.TimeoutError:
+                # Also covers events missed while the hub was reconnecting
+                final = await _final_event(task_id, max(seen, default=last_seq) + 1)
+                if final:
+                    yield final
+                    return
+                yield None
+                continue
+            event = json.loads(raw)
+            if event.get("seq", 0) <= last_seq or event.get("seq") in seen:
+                continue
+            seen.add(event["seq"])
+            yield event
+            if event["event"] in TERMINAL_EVENTS:
+                return
+    finally:
+        progress_hub.unsubscribe(task_id, queue)
+
+def format_sse(event: Optional[dict]) -> str:
+    """Formats an event for text/event-stream (None -> keep-alive comment)."""
+    if event is None:
+        return ": keep-alive\n\n"
+    return f"id: {event.get('seq', 0)}\nevent: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
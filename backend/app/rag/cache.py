@@ -0,0 +1,68 @@
+import hashlib
+import json
+import os
+from typing import List, Optional, Iterable
+
+from app.redis_client import redis_client
+
+# Constants
+RAG_CACHE_TTL = int(os.getenv("RAG_CACHE_TTL", "86400"))  # safety net; invalidation is by version
+
+STATS_KEY = "rag_cache:stats"  # HASH: hits / misses / saved_ms
+
+def _scope(user_id: Optional[int]) -> str:
+    # Queries without user_id search every user's cases
+    return str(user_id) if user_id is not None else "all"
+
+def get_version_key(user_id: Optional[int]) -> str:
+    return f"rag_version:{_scope(user_id)}"
+
+def get_cache_key(query_text: str, user_id: Optional[int], version: int, n_results: int, threshold: float) -> str:
+    digest = hashlib.sha256(query_text.encode("utf-8")).hexdigest()
+    return f"rag_cache:{_scope(user_id)}:v{version}:{digest}:{n_results}:{threshold}"
+
+async def get_version(user_id: Optional[int]) -> int:
+    value = await redis_client.get(get_version_key(user_id))
+    return int(value) if value else 0
+
+async def get_cached_results(key: str) -> Optional[List[str]]:
+    """Returns cached documents or None. A hit adds the original query latency to saved_ms."""
+    raw = await redis_client.get(key)
+    async with redis_client.pipeline(transaction=False) as pipe:
+        if raw:
+            entry = json.loads(raw)
+            pipe.hincrby(STATS_KEY, "hits", 1)
+            pipe.hincrbyfloat(STATS_KEY, "saved_ms", entry.get("latency_ms", 0))
+        else:
+            pipe.hincrby(STATS_KEY, "misses", 1)
+        await pipe.execute()
+    return entry["documents"] if raw else None
+
+async def cache_results(key: str, documents: List[str], latency_ms: float):
+    await redis_client.setex(
+        key, RAG_CACHE_TTL,
+        json.dumps({"documents": documents, "latency_ms": round(latency_ms, 2)}, ensure_ascii=False)
+    )
+
+async def bump_versions(user_ids: Iterable[Optional[int]]):
+    """Invalidates cached retrievals for these users (and cross-user queries) immediately."""
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for user_id in set(user_ids) | {None}:
+            pipe.incr(get_version_key(user_id))
+        await pipe.execute()
+
+async def get_rag_cache_stats() -> dict:
+    try:
+        stats = await redis_client.hgetall(STATS_KEY)
+    except Exception as e:
+        print(f"RAG Cache Stats Error: {e}")
+        return {}
+    hits = int(stats.get("hits", 0))
+    misses = int(stats.get("misses", 0))
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / total, 4) if total else 0.0,
+        "saved_ms": round(float(stats.get("saved_ms", 0)), 1),
+    }
@@ -0,0 +1,282 @@
+import fcntl
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import List, Dict, Optional, Tuple
+
+import numpy as np
+
+try:
+    import hnswlib  # optional: pip install hnswlib
+except ImportError:
+    hnswlib = None
+
+RAG_LOCAL_DIR = os.getenv("RAG_LOCAL_DIR", "/data/rag")
+RAG_HNSW_THRESHOLD = int(os.getenv("RAG_HNSW_THRESHOLD", "20000"))  # rows per shard before switching to HNSW
+RAG_HNSW_EF = int(os.getenv("RAG_HNSW_EF", "64"))
+
+def default_embedder():
+    """Same ONNX MiniLM model the Chroma server uses by default, so distances/thresholds match."""
+    from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+    embedding_function = DefaultEmbeddingFunction()
+    return lambda texts: np.asarray(embedding_function(texts), dtype=np.float32)
+
+class VectorShard:
+    """
+    Vectors and documents of one user.
+    On disk: vectors.f32 (raw float32 rows, memory-mapped on load) + meta.jsonl (append-only,
+    last record per row wins). A row is committed once its meta record is written.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.header_path = os.path.join(path, "header.json")
+        self.vectors_path = os.path.join(path, "vectors.f32")
+        self.meta_path = os.path.join(path, "meta.jsonl")
+        self.hnsw_path = os.path.join(path, "hnsw.bin")
+        self.hnsw_state_path = os.path.join(path, "hnsw.json")
+        self.lock = threading.RLock()
+
+        self.dim: Optional[int] = None
+        self.vectors: Optional[np.ndarray] = None
+        self.sq_norms: Optional[np.ndarray] = None
+        self.docs: List[Optional[str]] = []
+        self.ids: Dict[str, int] = {}
+        self.hnsw = None
+        self._loaded_stamp = None
+        self._loaded = False
+
+    # --- Loading ---
+
+    def _stamp(self):
+        try:
+            st = os.stat(self.meta_path)
+            return (st.st_size, st.st_mtime_ns)
+        except FileNotFoundError:
+            return None
+
+    def _ensure_loaded(self):
+        # Another process (API vs worker) may have written since we loaded
+        stamp = self._stamp()
+        if self._loaded and stamp == self._loaded_stamp:
+            return
+        self._load()
+        self._loaded_stamp = stamp
+        self._loaded = True
+
+    def _load(self):
+        self.vectors, self.sq_norms, self.hnsw = None, None, None
+        self.docs, self.ids = [], {}
+        if not os.path.exists(self.meta_path) or not os.path.exists(self.header_path):
+            return
+
+        with open(self.header_path, encoding="utf-8") as f:
+            self.dim = json.load(f)["dim"]
+
+        records = {}
+        with open(self.meta_path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # torn write
+                records[record["row"]] = record
+
+        if not records:
+            return
+
+        # Ignore a partially written trailing vector
+        rows = min(max(records) + 1, os.path.getsize(self.vectors_path) // (4 * self.dim))
+        if rows <= 0:
+            return
+
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+        self.sq_norms = np.einsum("ij,ij->i", self.vectors, self.vectors)
+        self.docs = [None] * rows
+        for row, record in records.items():
+            if row < rows:
+                self.docs[row] = record["text"]
+                self.ids[record["id"]] = row
+
+    # --- Writing ---
+
+    @contextmanager
+    def _file_lock(self):
+        """Serializes writers across processes."""
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def upsert(self, doc_ids: List[str], texts: List[str], metadatas: List[Dict], vectors: np.ndarray):
+        with self.lock, self._file_lock():
+            self._ensure_loaded()
+
+            dim = int(vectors.shape[1])
+            if self.dim is None or not os.path.exists(self.header_path):
+                with open(self.header_path, "w", encoding="utf-8") as f:
+                    json.dump({"dim": dim}, f)
+                self.dim = dim
+            elif dim != self.dim:
+                raise ValueError(f"Embedding dim {dim} doesn't match shard dim {self.dim}")
+
+            next_row = len(self.docs)
+            records = []
+            fd = os.open(self.vectors_path, os.O_RDWR | os.O_CREAT)
+            with os.fdopen(fd, "r+b") as f:
+                for doc_id, text, metadata, vector in zip(doc_ids, texts, metadatas, vectors):
+                    row = self.ids.get(doc_id)
+                    if row is None:
+                        row = next_row
+                        next_row += 1
+                        self.ids[doc_id] = row
+                    f.seek(row * dim * 4)
+                    f.write(np.asarray(vector, dtype=np.float32).tobytes())
+                    records.append({"row": row, "id": doc_id, "text": text, "metadata": metadata})
+                f.flush()
+                os.fsync(f.fileno())
+
+            with open(self.meta_path, "a", encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+            # Reload (lazily) on next search
+            self._loaded = False
+
+    # --- Search ---
+
+    def _get_hnsw(self):
+        """Loads the persisted HNSW graph and applies rows written since it was saved."""
+        if self.hnsw is not None:
+            return self.hnsw
+
+        rows = len(self.vectors)
+        index = hnswlib.Index(space="l2", dim=self.dim)  # squared L2, same as Chroma's default
+        state = None
+        if os.path.exists(self.hnsw_state_path) and os.path.exists(self.hnsw_path):
+            with open(self.hnsw_state_path, encoding="utf-8") as f:
+                state = json.load(f)
+
+        if state:
+            index.load_index(self.hnsw_path, max_elements=rows)
+            # meta.jsonl is append-only: everything after the saved offset is new or updated
+            changed = set()
+            with open(self.meta_path, encoding="utf-8") as f:
+                f.seek(state["meta_offset"])
+                for line in f:
+                    try:
+                        changed.add(json.loads(line)["row"])
+                    except ValueError:
+                        continue
+            changed = sorted(row for row in changed if row < rows)
+            if changed:
+                index.add_items(np.asarray(self.vectors[changed]), np.asarray(changed))
+            needs_save = len(changed) > rows * 0.1
+        else:
+            index.init_index(max_elements=rows, ef_construction=200, M=16)
+            index.add_items(np.asarray(self.vectors), np.arange(rows))
+            needs_save = True
+
+        if needs_save:
+            index.save_index(self.hnsw_path)
+            with open(self.hnsw_state_path, "w", encoding="utf-8") as f:
+                json.dump({"meta_offset": self._loaded_stamp[0], "rows": rows}, f)
+
+        self.hnsw = index
+        return index
+
+    def search(self, query_vector: np.ndarray, k: int) -> List[Tuple[float, str]]:
+        """Returns [(squared L2 distance, document)] for the k nearest rows."""
+        with self.lock:
+            self._ensure_loaded()
+            vectors, sq_norms, docs = self.vectors, self.sq_norms, self.docs
+            if vectors is None or not len(vectors):
+                return []
+            rows = len(vectors)
+            k = min(k, rows)
+
+            if hnswlib is not None and rows >= RAG_HNSW_THRESHOLD:
+                index = self._get_hnsw()
+                index.set_ef(max(RAG_HNSW_EF, k))
+                labels, distances = index.knn_query(query_vector, k=k)
+                return [(float(d), docs[int(i)]) for d, i in zip(distances[0], labels[0]) if docs[int(i)] is not None]
+
+        # Brute force: |v - q|^2 = |v|^2 - 2 v.q + |q|^2, one matrix-vector product
+        distances = sq_norms - 2.0 * (vectors @ query_vector) + float(query_vector @ query_vector)
+        top = np.argpartition(distances, k - 1)[:k] if k < rows else np.arange(rows)
+        top = top[np.argsort(distances[top])]
+        return [(float(distances[i]), docs[i]) for i in top if docs[i] is not None]
+
+class LocalVectorBackend:
+    """In-process RAG backend: one memory-mapped vector shard per user, loaded lazily."""
+
+    def __init__(self, base_dir: str = RAG_LOCAL_DIR, embed=None):
+        self.base_dir = base_dir
+        os.makedirs(base_dir, exist_ok=True)
+        self._embed = embed
+        self._shards: Dict[str, VectorShard] = {}
+        self._lock = threading.Lock()
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        if self._embed is None:
+            self._embed = default_embedder()
+        return self._embed(texts)
+
+    @staticmethod
+    def shard_name(user_id) -> str:
+        return f"user_{user_id}" if user_id is not None else "shared"
+
+    def _shard(self, name: str) -> VectorShard:
+        with self._lock:
+            shard = self._shards.get(name)
+            if shard is None:
+                shard = VectorShard(os.path.join(self.base_dir, name))
+                self._shards[name] = shard
+            return shard
+
+    def add_documents(self, documents: List[str], metadatas: List[Dict], ids: List[str]):
+        self.add_cases([
+            {"doc_id": doc_id, "text": text, "metadata": metadata}
+            for doc_id, text, metadata in zip(ids, documents, metadatas)
+        ])
+
+    def add_cases(self, cases: List[Dict]):
+        if not cases:
+            return
+        # One embedding call for the whole batch, then one write per shard
+        vectors = self.embed([case["text"] for case in cases])
+        by_shard: Dict[str, List[int]] = {}
+        for i, case in enumerate(cases):
+            by_shard.setdefault(self.shard_name((case["metadata"] or {}).get("user_id")), []).append(i)
+
+        for name, indices in by_shard.items():
+            self._shard(name).upsert(
+                [cases[i]["doc_id"] for i in indices],
+                [cases[i]["text"] for i in indices],
+                [cases[i]["metadata"] for i in indices],
+                vectors[indices]
+            )
+
+    def query(self, query_text: str, user_id: int | None = None, n_results: int = 3, threshold: float = 1.5) -> List[str]:
+        """Same contract as the Chroma backend."""
+        query_vector = self.embed([query_text])[0]
+
+        if user_id is not None:
+            names = [self.shard_name(user_id)]
+        else:
+            # No user filter: search across all shards
+            names = [name for name in os.listdir(self.base_dir) if os.path.isdir(os.path.join(self.base_dir, name))]
+
+        hits = []
+        for name in names:
+            hits.extend(self._shard(name).search(query_vector, n_results))
+        hits.sort(key=lambda hit: hit[0])
+
+        return [doc for distance, doc in hits[:n_results] if distance <= threshold]
@@ -1,70 +1,173 @@
-import chromadb
-from chromadb.config import Settings
+import asyncio
+import json
 import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict
 
+from app.rag import cache as rag_cache
+from app.redis_client import redis_client
+
+# "chroma" (default) or "local" - see app/rag/local_index.py
+RAG_BACKEND = os.getenv("RAG_BACKEND", "chroma")
+
+# Timeouts / batching for RAG access
+RAG_TIMEOUT = float(os.getenv("RAG_TIMEOUT", "10"))
+RAG_MAX_WORKERS = int(os.getenv("RAG_MAX_WORKERS", "8"))
+RAG_INGEST_BATCH_SIZE = int(os.getenv("RAG_INGEST_BATCH_SIZE", "32"))
+RAG_INGEST_FLUSH_INTERVAL = float(os.getenv("RAG_INGEST_FLUSH_INTERVAL", "2"))
+RAG_INGEST_QUEUE = "rag_ingest:queue"  # LIST: liked cases (JSON) waiting for the batched upsert
+RAG_INGEST_LOCK_KEY = "rag_ingest:lock"
+RAG_INGEST_LOCK_TTL = int(max(30, RAG_TIMEOUT * 3))
+
+def create_backend(name: str = None):
+    """Vector backend by name: "chroma" (ChromaDB server) or "local" (in-process shards)."""
+    name = name or RAG_BACKEND
+    if name == "local":
+        from app.rag.local_index import LocalVectorBackend
+        return LocalVectorBackend()
+    from app.rag.chroma_backend import ChromaBackend
+    return ChromaBackend()
+
 class RAGStore:
-    def __init__(self):
-        host = os.getenv("CHROMA_DB_HOST", "chromadb")
-        port = os.getenv("CHROMA_DB_PORT", "8000")
-        
-        # Connect to ChromaDB server
-        self.client = chromadb.HttpClient(host=host, port=int(port))
-        
-        # Get or create collection
-        self.collection = self.client.get_or_create_collection(name="brand_context")
+    def __init__(self, backend=None):
+        self.backend = backend or create_backend()
+
+        # Sync backend calls are offloaded here by the async API
+        self.executor = ThreadPoolExecutor(max_workers=RAG_MAX_WORKERS, thread_name_prefix="rag")
+
+        # Delayed flush of the ingest queue
+        self._flush_task = None
 
     def add_documents(self, documents: List[str], metadatas: List[Dict], ids: List[str]):
         """Add documents to the vector store."""
-        self.collection.add(
-            documents=documents,
-            metadatas=metadatas,
-            ids=ids
-        )
+        self.backend.add_documents(documents, metadatas, ids)
 
     def add_case(self, doc_id: str, text: str, metadata: Dict):
         """Add a single case to the vector store."""
-        self.collection.add(
-            documents=[text],
-            metadatas=[metadata],
-            ids=[doc_id]
-        )
+        self.add_cases([{"doc_id": doc_id, "text": text, "metadata": metadata}])
+
+    def add_cases(self, cases: List[Dict]):
+        """
+        Embed and upsert many cases in one request.
+        Each case: {"doc_id", "text", "metadata"}. Re-liking a plan overwrites its entry.
+        """
+        self.backend.add_cases(cases)
 
     def query(self, query_text: str, user_id: int | None = None, n_results: int = 3, threshold: float = 1.5) -> List[str]:
         """Retrieve relevant documents with distance threshold, optionally filtered by user_id."""
-        
-        # Build query params
-        query_params = {
-            "query_texts": [query_text],
-            "n_results": n_results
-        }
-        
-        # Only filter by user_id if provided (for API calls)
-        # Workflow/Agents may call without user_id to search across all users
-        if user_id is not None:
-            query_params["where"] = {"user_id": user_id}
-        
-        results = self.collection.query(**query_params)
-        
-        # results['distances'] contains the distance metric (lower is better)
-        # results['documents'] contains the text
-        
-        if not results['documents']:
-            return []
-            
-        final_docs = []
-        distances = results['distances'][0] if 'distances' in results and results['distances'] else []
-        documents = results['documents'][0]
-        
-        
-        for i, doc in enumerate(documents):
-            if distances:
-                dist = distances[i]
-                if dist > threshold:
-                    continue
-            final_docs.append(doc)
-            
-        return final_docs
+        return self.backend.query(query_text, user_id=user_id, n_results=n_results, threshold=threshold)
+
+    # --- Async API (non-blocking for the event loop) ---
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await asyncio.wait_for(
+            loop.run_in_executor(self.executor, lambda: func(*args, **kwargs)),
+            timeout=RAG_TIMEOUT
+        )
+
+    async def aquery(self, query_text: str, user_id: int | None = None, n_results: int = 3, threshold: float = 1.5, use_cache: bool = True) -> List[str]:
+        """Async query, served from the retrieval cache when the user's cases haven't changed."""
+        key = None
+        if use_cache:
+            try:
+                version = await rag_cache.get_version(user_id)
+                key = rag_cache.get_cache_key(query_text, user_id, version, n_results, threshold)
+                cached = await rag_cache.get_cached_results(key)
+                if cached is not None:
+                    return cached
+            except Exception as e:
+                print(f"RAG Cache Read Error: {e}")
+                key = None
+
+        start = time.perf_counter()
+        documents = await self._run(self.query, query_text, user_id=user_id, n_results=n_results, threshold=threshold)
+
+        if key:
+            try:
+                await rag_cache.cache_results(key, documents, (time.perf_counter() - start) * 1000)
+            except Exception as e:
+                print(f"RAG Cache Write Error: {e}")
+        return documents
+
+    async def aadd_cases(self, cases: List[Dict]):
+        loop = asyncio.get_running_loop()
+        upsert = loop.run_in_executor(self.executor, self.add_cases, cases)
+        try:
+            await asyncio.wait_for(asyncio.shield(upsert), timeout=RAG_TIMEOUT)
+        finally:
+            # New cases change retrieval results for their users: drop cached ones right away,
+            # whatever the outcome (a timed-out or failed upsert may still have written some of them)
+            await self._invalidate(cases)
+            if not upsert.done():
+                # Timed out but the thread is still writing: invalidate again once it lands
+                upsert.add_done_callback(lambda _: asyncio.ensure_future(self._invalidate(cases)))
+
+    async def _invalidate(self, cases: List[Dict]):
+        try:
+            await rag_cache.bump_versions((case["metadata"] or {}).get("user_id") for case in cases)
+        except Exception as e:
+            print(f"RAG Cache Invalidation Error: {e}")
+
+    async def enqueue_case(self, doc_id: str, text: str, metadata: Dict):
+        """
+        Queues a case for batched ingest in a Redis list, so a crash or restart doesn't drop it.
+        Flushes when RAG_INGEST_BATCH_SIZE cases are pending or RAG_INGEST_FLUSH_INTERVAL seconds
+        after the first one arrived; workers also drain the queue (see app/worker.py).
+        Raises if the case couldn't be queued.
+        """
+        case = {"doc_id": doc_id, "text": text, "metadata": metadata}
+        pending = await redis_client.rpush(RAG_INGEST_QUEUE, json.dumps(case, ensure_ascii=False, default=str))
+        if pending >= RAG_INGEST_BATCH_SIZE:
+            await self.flush()
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(RAG_INGEST_FLUSH_INTERVAL)
+        await self.flush()
+
+    async def flush(self) -> int:
+        """
+        Drains the ingest queue, one upsert per RAG_INGEST_BATCH_SIZE cases. A batch leaves the queue
+        only after its upsert succeeded; on failure it stays queued for the next flush.
+        One flusher at a time across processes. Returns the number of cases written.
+        """
+        token = uuid.uuid4().hex
+        try:
+            if not await redis_client.set(RAG_INGEST_LOCK_KEY, token, nx=True, ex=RAG_INGEST_LOCK_TTL):
+                return 0
+        except Exception as e:
+            print(f"RAG Ingest Error: {e}")
+            return 0
+
+        written = 0
+        try:
+            while True:
+                raw = await redis_client.lrange(RAG_INGEST_QUEUE, 0, RAG_INGEST_BATCH_SIZE - 1)
+                if not raw:
+                    break
+                batch = [json.loads(item) for item in raw]
+                try:
+                    await self.aadd_cases(batch)
+                except Exception as e:
+                    print(f"RAG Ingest Error ({len(batch)} cases kept queued): {e}")
+                    break
+                # Upserts are keyed by doc_id, so a batch written twice (crash before LTRIM) is harmless
+                await redis_client.ltrim(RAG_INGEST_QUEUE, len(raw), -1)
+                await redis_client.expire(RAG_INGEST_LOCK_KEY, RAG_INGEST_LOCK_TTL)
+                written += len(raw)
+        except Exception as e:
+            print(f"RAG Ingest Error: {e}")
+        finally:
+            try:
+                if await redis_client.get(RAG_INGEST_LOCK_KEY) == token:
+                    await redis_client.delete(RAG_INGEST_LOCK_KEY)
+            except Exception as e:
+                print(f"RAG Ingest Lock Error: {e}")
+        return written
 
 # Global instance
 rag_store = RAGStore()
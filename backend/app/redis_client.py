@@ -0,0 +1,27 @@
+import os
+
+import redis.asyncio as aioredis
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "100"))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "5"))  # wait for a free connection instead of failing
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "5"))
+
+# One connection pool per process, shared by every module (task queue, caches, pub/sub, auth).
+# Blocking stream reads hold a connection while they wait; progress pub/sub uses a single
+# subscriber per process (app/progress.py), however many watchers are connected.
+pool = aioredis.BlockingConnectionPool.from_url(
+    REDIS_URL,
+    max_connections=REDIS_MAX_CONNECTIONS,
+    timeout=REDIS_POOL_TIMEOUT,
+    socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+    health_check_interval=30,
+    decode_responses=True,
+)
+
+redis_client = aioredis.Redis(connection_pool=pool)
+
+async def close_redis():
+    """Closes all pooled connections (call on shutdown)."""
+    await redis_client.aclose()
+    await pool.disconnect()
@@ -1,17 +1,36 @@
 from minio import Minio
+from minio.error import S3Error
+import asyncio
 import os
 import io
 import json
+import urllib3
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
+from typing import Optional
+from app.history_index import upsert_plan_index
+
+# Concurrency / timeouts for MinIO calls
+MINIO_MAX_WORKERS = int(os.getenv("MINIO_MAX_WORKERS", "16"))
+MINIO_CONNECT_TIMEOUT = float(os.getenv("MINIO_CONNECT_TIMEOUT", "5"))
+MINIO_READ_TIMEOUT = float(os.getenv("MINIO_READ_TIMEOUT", "30"))
 
 class StorageClient:
     def __init__(self):
+        # Pool sized to the worker threads so parallel reads don't discard connections
+        http_client = urllib3.PoolManager(
+            timeout=urllib3.Timeout(connect=MINIO_CONNECT_TIMEOUT, read=MINIO_READ_TIMEOUT),
+            maxsize=MINIO_MAX_WORKERS,
+            retries=urllib3.Retry(total=3, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504])
+        )
         self.client = Minio(
             endpoint=os.getenv("MINIO_ENDPOINT", "minio:9000"),
             access_key=os.getenv("MINIO_ROOT_USER", "minioadmin"),
             secret_key=os.getenv("MINIO_ROOT_PASSWORD", "minioadmin"),
-            secure=False
+            secure=False,
+            http_client=http_client
         )
+        self.executor = ThreadPoolExecutor(max_workers=MINIO_MAX_WORKERS, thread_name_prefix="minio")
         self.history_bucket = "history"
         self.rag_bucket = "rag-knowledge"
 
@@ -28,6 +47,15 @@ class StorageClient:
         except Exception as e:
             print(f"MinIO Init Error ({bucket_name}): {e}")
 
+    def _read_json(self, bucket: str, object_name: str) -> dict:
+        """Reads a JSON object and always returns the connection to the pool."""
+        response = self.client.get_object(bucket, object_name)
+        try:
+            return json.loads(response.read())
+        finally:
+            response.close()
+            response.release_conn()
+
     def save_generation(self, user_id: int, plan_id: str, data: dict):
         """Saves the full generation data to the history bucket."""
         try:
@@ -40,6 +68,8 @@ class StorageClient:
                 len(json_data),
                 content_type="application/json"
             )
+            # Keep the /history index in sync (also covers update_generation)
+            upsert_plan_index(user_id, plan_id, data)
             return True
         except Exception as e:
             print(f"MinIO Save Error: {e}")
@@ -66,8 +96,7 @@ class StorageClient:
     def get_generation(self, user_id: int, plan_id: str) -> dict:
         """Reads generation data from history bucket."""
         try:
-            response = self.client.get_object(self.history_bucket, f"users/{user_id}/plans/{plan_id}/data.json")
-            return json.loads(response.read())
+            return self._read_json(self.history_bucket, f"users/{user_id}/plans/{plan_id}/data.json")
         except Exception as e:
             print(f"MinIO Read Error: {e}")
             return None
@@ -88,32 +117,64 @@ class StorageClient:
             print(f"MinIO Update Error: {e}")
             return False
 
-    def list_generations(self, user_id: int, limit: int = 10) -> list:
-        """Lists recent generations from history bucket."""
+    def _list_data_files(self, user_id: int) -> list:
+        """Lists the user's data.json objects, newest first. Raises on listing errors."""
+        prefix = f"users/{user_id}/plans/"
+        objects = self.client.list_objects(self.history_bucket, prefix=prefix, recursive=True)
+        data_files = [obj for obj in objects if obj.object_name.endswith("data.json")]
+        data_files.sort(key=lambda x: x.last_modified, reverse=True)
+        return data_files
+
+    def _read_json_or_skip(self, object_name: str) -> Optional[dict]:
+        """Reads one plan; None if the object is corrupt or already gone. Other errors propagate."""
         try:
-            # List objects with prefix
-            prefix = f"users/{user_id}/plans/"
-            objects = list(self.client.list_objects(self.history_bucket, prefix=prefix, recursive=True))
-            
-            # Filter for data.json files
-            data_files = [obj for obj in objects if obj.object_name.endswith("data.json")]
-            
-            # Sort by Last Modified Descending
-            data_files.sort(key=lambda x: x.last_modified, reverse=True)
-            
-            # Take top N
-            recent_files = data_files[:limit]
-            
-            results = []
-            for obj in recent_files:
-                response = self.client.get_object(self.history_bucket, obj.object_name)
-                data = json.loads(response.read())
-                results.append(data)
-                
-            return results
-        except Exception as e:
-            print(f"MinIO List Error: {e}")
-            return []
+            return self._read_json(self.history_bucket, object_name)
+        except ValueError as e:
+            print(f"MinIO Skip Unreadable ({object_name}): {e}")
+        except S3Error as e:
+            if e.code != "NoSuchKey":
+                raise
+        return None
+
+    def list_all_generations(self, user_id: int) -> list:
+        """
+        Every plan of the user, for the one-time history backfill (/history itself reads the index).
+        Listing and connection errors raise, so a partial listing is never taken as complete;
+        a corrupt object is skipped on its own instead of failing the whole listing.
+        """
+        data_files = self._list_data_files(user_id)
+        plans = self.executor.map(lambda obj: self._read_json_or_skip(obj.object_name), data_files)
+        return [plan for plan in plans if plan is not None]
+
+class AsyncStorageClient:
+    """
+    Non-blocking facade over StorageClient for async endpoints.
+    MinIO calls run on the storage thread pool, which also bounds concurrency.
+    """
+    def __init__(self, sync_client: StorageClient):
+        self.sync = sync_client
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.sync.executor, func, *args)
+
+    async def save_generation(self, user_id: int, plan_id: str, data: dict) -> bool:
+        return await self._run(self.sync.save_generation, user_id, plan_id, data)
+
+    async def get_generation(self, user_id: int, plan_id: str) -> dict:
+        return await self._run(self.sync.get_generation, user_id, plan_id)
+
+    async def update_generation(self, user_id: int, plan_id: str, updates: dict) -> bool:
+        return await self._run(self.sync.update_generation, user_id, plan_id, updates)
+
+    async def promote_to_rag(self, user_id: int, plan_id: str, category: str = "ROUTINE") -> bool:
+        return await self._run(self.sync.promote_to_rag, user_id, plan_id, category)
+
+    async def list_all_generations(self, user_id: int) -> list:
+        # Runs the listing itself in a plain thread: it fans out onto the storage pool,
+        # and waiting on it from a pool thread could deadlock when the pool is saturated
+        return await asyncio.to_thread(self.sync.list_all_generations, user_id)
 
 # Global instance
 storage = StorageClient()
+async_storage = AsyncStorageClient(storage)
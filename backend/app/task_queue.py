@@ -1,9 +1,12 @@
 import os
 import json
-import redis
+import random
+import time
+from redis.exceptions import ResponseError
 from enum import Enum
 from typing import Optional, Dict, Any
 from datetime import datetime
+from app.redis_client import redis_client
 
 class TaskStatus(str, Enum):
     PENDING = "pending"
@@ -11,80 +14,265 @@ class TaskStatus(str, Enum):
     READY = "ready"
     ERROR = "error"
 
-# Redis connection
-redis_client = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
-
 # Constants
 MAX_ACTIVE_TASKS = 3
 TASK_TTL = 3600  # 1 hour
 
+# Job queue (Redis Streams)
+JOB_STREAM = "generation_jobs"
+JOB_GROUP = "generation_workers"
+DELAYED_JOBS_KEY = "generation_jobs:delayed"  # ZSET: job payload -> time it becomes ready
+DEAD_LETTER_STREAM = "generation_jobs:dead"
+JOB_VISIBILITY_TIMEOUT = int(os.getenv("JOB_VISIBILITY_TIMEOUT", "300"))  # seconds without heartbeat before reclaim
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BASE_DELAY = float(os.getenv("JOB_RETRY_BASE_DELAY", "10"))
+JOB_RETRY_MAX_DELAY = float(os.getenv("JOB_RETRY_MAX_DELAY", "300"))
+
 def get_task_key(task_id: str) -> str:
     return f"task:{task_id}"
 
 def get_user_tasks_key(user_id: int) -> str:
     return f"user_tasks:{user_id}"
 
-def save_task(task_id: str, user_id: int, status: TaskStatus, data: Optional[Dict] = None, error: Optional[str] = None):
-    """Save or update task status in Redis."""
-    task_data = {
-        "id": task_id,
-        "user_id": user_id,
-        "status": status.value,
-        "data": data,
-        "error": error,
-        "created_at": datetime.now().isoformat(),
-        "updated_at": datetime.now().isoformat()
-    }
-    
-    redis_client.setex(
-        get_task_key(task_id),
-        TASK_TTL,
-        json.dumps(task_data, default=str)
+def get_user_batch_tasks_key(user_id: int) -> str:
+    return f"user_batch_tasks:{user_id}"  # SET: the user's batch tasks released to workers and not finished
+
+# Transition order: a task only moves forward, terminal states are final
+STATUS_RANK = {
+    TaskStatus.PENDING: 0,
+    TaskStatus.PROCESSING: 1,
+    TaskStatus.READY: 2,
+    TaskStatus.ERROR: 2,
+}
+ACTIVE_STATUSES = (TaskStatus.PENDING, TaskStatus.PROCESSING)
+
+# The scripts below also touch keys they derive from stored ids ('task:' .. member,
+# 'batch:' .. batch_id, 'user_tasks:' .. user_id), which KEYS can't list in advance.
+# That assumes a single Redis node (or replicas of one): under Redis Cluster these keys
+# could live in different slots and the scripts would fail with CROSSSLOT.
+
+# Atomic admission: drop finished/expired tasks from the user's active set,
+# then reserve a slot and create the task hash in the same step.
+# Tasks stored as JSON strings (before tasks moved to hashes) can't progress any more and are dropped too.
+# KEYS: user_tasks, task | ARGV: task_id, user_id, limit, ttl, now
+RESERVE_TASK_SCRIPT = """
+local active = redis.call('SMEMBERS', KEYS[1])
+for _, member in ipairs(active) do
+    local task_key = 'task:' .. member
+    local status = nil
+    if redis.call('TYPE', task_key).ok == 'hash' then
+        status = redis.call('HGET', task_key, 'status')
+    end
+    if not status or (status ~= 'pending' and status ~= 'processing') then
+        redis.call('SREM', KEYS[1], member)
+    end
+end
+if redis.call('SCARD', KEYS[1]) >= tonumber(ARGV[3]) then
+    return 0
+end
+redis.call('HSET', KEYS[2], 'id', ARGV[1], 'user_id', ARGV[2], 'status', 'pending',
+    'created_at', ARGV[5], 'updated_at', ARGV[5])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+redis.call('SADD', KEYS[1], ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return 1
+"""
+
+# Monotonic state change with a partial hash update. Returns 1 if applied,
+# 0 if it would move backwards / out of a terminal state, -1 if the task doesn't exist.
+# Batch tasks (see app/batches.py) count towards their batch instead of the user's active set.
+# KEYS: task | ARGV: status, rank, updated_at, data, error, ttl, active
+UPDATE_STATUS_SCRIPT = """
+if redis.call('TYPE', KEYS[1]).ok ~= 'hash' then
+    return -1
+end
+local rank = {pending = 0, processing = 1, ready = 2, error = 2}
+local current = rank[redis.call('HGET', KEYS[1], 'status')] or 0
+local target = tonumber(ARGV[2])
+if current >= 2 or target < current then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'status', ARGV[1], 'updated_at', ARGV[3])
+if ARGV[4] ~= '' then redis.call('HSET', KEYS[1], 'data', ARGV[4]) end
+if ARGV[5] ~= '' then redis.call('HSET', KEYS[1], 'error', ARGV[5]) end
+redis.call('EXPIRE', KEYS[1], ARGV[6])
+local batch_id = redis.call('HGET', KEYS[1], 'batch_id')
+if batch_id then
+    if target >= 2 then
+        redis.call('HINCRBY', 'batch:' .. batch_id, ARGV[1], 1)
+        redis.call('SREM', 'user_batch_tasks:' .. redis.call('HGET', KEYS[1], 'user_id'), redis.call('HGET', KEYS[1], 'id'))
+    end
+    return 1
+end
+local user_tasks = 'user_tasks:' .. redis.call('HGET', KEYS[1], 'user_id')
+local task_id = redis.call('HGET', KEYS[1], 'id')
+if ARGV[7] == '1' then
+    redis.call('SADD', user_tasks, task_id)
+else
+    redis.call('SREM', user_tasks, task_id)
+end
+return 1
+"""
+
+reserve_task_script = redis_client.register_script(RESERVE_TASK_SCRIPT)
+update_status_script = redis_client.register_script(UPDATE_STATUS_SCRIPT)
+
+async def reserve_task(task_id: str, user_id: int) -> bool:
+    """
+    Creates a pending task if the user has fewer than MAX_ACTIVE_TASKS active ones.
+    Check and reservation happen in one script, so concurrent requests can't overshoot the limit.
+    """
+    reserved = await reserve_task_script(
+        keys=[get_user_tasks_key(user_id), get_task_key(task_id)],
+        args=[task_id, user_id, MAX_ACTIVE_TASKS, TASK_TTL, datetime.now().isoformat()]
     )
-    
-    # Track active tasks per user
-    if status in [TaskStatus.PENDING, TaskStatus.PROCESSING]:
-        redis_client.sadd(get_user_tasks_key(user_id), task_id)
-        redis_client.expire(get_user_tasks_key(user_id), TASK_TTL)
-    else:
-        redis_client.srem(get_user_tasks_key(user_id), task_id)
+    return bool(reserved)
 
-def get_task(task_id: str) -> Optional[Dict]:
+async def get_task(task_id: str) -> Optional[Dict]:
     """Get task status from Redis."""
-    data = redis_client.get(get_task_key(task_id))
-    if data:
-        return json.loads(data)
-    return None
-
-def update_task_status(task_id: str, status: TaskStatus, data: Optional[Dict] = None, error: Optional[str] = None):
-    """Update existing task status."""
-    existing = get_task(task_id)
-    if existing:
-        existing["status"] = status.value
-        existing["updated_at"] = datetime.now().isoformat()
-        if data:
-            existing["data"] = data
-        if error:
-            existing["error"] = error
-        
-        redis_client.setex(
-            get_task_key(task_id),
+    try:
+        fields = await redis_client.hgetall(get_task_key(task_id))
+    except ResponseError:
+        # Task written as a JSON string before tasks moved to hashes
+        data = await redis_client.get(get_task_key(task_id))
+        return json.loads(data) if data else None
+    return decode_task(task_id, fields)
+
+def decode_task(task_id: str, fields: Dict) -> Optional[Dict]:
+    """Converts a task hash into the dict returned by the API."""
+    if not fields:
+        return None
+    return {
+        "id": fields.get("id", task_id),
+        "user_id": int(fields["user_id"]) if fields.get("user_id") else None,
+        "status": fields.get("status"),
+        "data": json.loads(fields["data"]) if fields.get("data") else None,
+        "error": fields.get("error") or None,
+        "created_at": fields.get("created_at"),
+        "updated_at": fields.get("updated_at"),
+    }
+
+async def update_task_status(task_id: str, status: TaskStatus, data: Optional[Dict] = None, error: Optional[str] = None) -> bool:
+    """
+    Moves a task to a new status in one round trip. Only forward transitions are applied
+    (pending -> processing -> ready/error); returns False if the task is finished or gone.
+    """
+    applied = await update_status_script(
+        keys=[get_task_key(task_id)],
+        args=[
+            status.value,
+            STATUS_RANK[status],
+            datetime.now().isoformat(),
+            json.dumps(data, default=str) if data else "",
+            error or "",
             TASK_TTL,
-            json.dumps(existing, default=str)
-        )
-        
-        # Update user tasks set
-        user_id = existing.get("user_id")
-        if user_id:
-            if status in [TaskStatus.PENDING, TaskStatus.PROCESSING]:
-                redis_client.sadd(get_user_tasks_key(user_id), task_id)
-            else:
-                redis_client.srem(get_user_tasks_key(user_id), task_id)
-
-def get_active_task_count(user_id: int) -> int:
-    """Get count of active (pending/processing) tasks for user."""
-    return redis_client.scard(get_user_tasks_key(user_id))
-
-def can_start_task(user_id: int) -> bool:
-    """Check if user can start a new task."""
-    return get_active_task_count(user_id) < MAX_ACTIVE_TASKS
+            "1" if status in ACTIVE_STATUSES else "0",
+        ]
+    )
+    return applied == 1
+
+# --- Job Queue ---
+
+async def ensure_job_group():
+    """Creates the stream and consumer group if they don't exist yet."""
+    try:
+        await redis_client.xgroup_create(JOB_STREAM, JOB_GROUP, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+def job_fields(task_id: str, news, user_id: int, attempt: int, batch_id: Optional[str] = None) -> Dict[str, str]:
+    news_data = news.dict() if hasattr(news, "dict") else news
+    fields = {
+        "task_id": task_id,
+        "user_id": str(user_id),
+        "news": json.dumps(news_data, ensure_ascii=False, default=str),
+        "attempt": str(attempt),
+    }
+    if batch_id:
+        fields["batch_id"] = batch_id
+    return fields
+
+def parse_job(fields: Dict) -> Dict[str, Any]:
+    """Decodes raw stream fields into task_id / user_id / news dict / attempt / batch_id."""
+    fields = {
+        (k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+        for k, v in fields.items()
+    }
+    return {
+        "task_id": fields["task_id"],
+        "user_id": int(fields["user_id"]),
+        "news": json.loads(fields["news"]),
+        "attempt": int(fields.get("attempt", 1)),
+        "batch_id": fields.get("batch_id"),
+    }
+
+async def enqueue_generation(task_id: str, news, user_id: int, attempt: int = 1, delay: float = 0, batch_id: Optional[str] = None):
+    """Adds a generation job to the stream (or to the delayed set when delay > 0)."""
+    fields = job_fields(task_id, news, user_id, attempt, batch_id)
+    if delay > 0:
+        await redis_client.zadd(DELAYED_JOBS_KEY, {json.dumps(fields): time.time() + delay})
+    else:
+        await redis_client.xadd(JOB_STREAM, fields)
+
+async def promote_delayed_jobs(limit: int = 100) -> int:
+    """Moves delayed jobs whose backoff has elapsed into the stream."""
+    due = await redis_client.zrangebyscore(DELAYED_JOBS_KEY, 0, time.time(), start=0, num=limit)
+    promoted = 0
+    for payload in due:
+        # ZREM wins for exactly one worker, so a job is never promoted twice
+        if await redis_client.zrem(DELAYED_JOBS_KEY, payload):
+            await redis_client.xadd(JOB_STREAM, json.loads(payload))
+            promoted += 1
+    return promoted
+
+async def read_jobs(consumer: str, count: int = 1, block_ms: int = 5000) -> list:
+    """Reads new jobs for this consumer. Returns [(message_id, fields), ...]."""
+    response = await redis_client.xreadgroup(JOB_GROUP, consumer, {JOB_STREAM: ">"}, count=count, block=block_ms)
+    if not response:
+        return []
+    return response[0][1]
+
+async def claim_stale_jobs(consumer: str, count: int = 10) -> list:
+    """Claims jobs whose worker stopped heartbeating (crashed) for longer than the visibility timeout."""
+    response = await redis_client.xautoclaim(
+        JOB_STREAM, JOB_GROUP, consumer,
+        min_idle_time=JOB_VISIBILITY_TIMEOUT * 1000,
+        start_id="0-0",
+        count=count
+    )
+    # [next_start_id, messages, deleted_ids] - entries deleted from the stream come back empty
+    return [(msg_id, fields) for msg_id, fields in response[1] if fields]
+
+async def heartbeat_job(consumer: str, message_id):
+    """Resets the idle time of a job that is still being processed."""
+    await redis_client.xclaim(JOB_STREAM, JOB_GROUP, consumer, 0, [message_id], justid=True)
+
+async def ack_job(message_id):
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.xack(JOB_STREAM, JOB_GROUP, message_id)
+        pipe.xdel(JOB_STREAM, message_id)
+        await pipe.execute()
+
+def retry_delay(attempt: int) -> float:
+    """Exponential backoff with jitter."""
+    delay = min(JOB_RETRY_BASE_DELAY * (2 ** (attempt - 1)), JOB_RETRY_MAX_DELAY)
+    return delay * random.uniform(0.8, 1.2)
+
+async def retry_job(message_id, job: Dict[str, Any]):
+    """Acks the current delivery and schedules the next attempt with backoff."""
+    await enqueue_generation(
+        job["task_id"], job["news"], job["user_id"],
+        attempt=job["attempt"] + 1,
+        delay=retry_delay(job["attempt"]),
+        batch_id=job.get("batch_id")
+    )
+    await ack_job(message_id)
+
+async def dead_letter_job(message_id, job: Dict[str, Any], error: str):
+    """Moves a job that exhausted its attempts to the dead-letter stream."""
+    fields = job_fields(job["task_id"], job["news"], job["user_id"], job["attempt"], job.get("batch_id"))
+    fields["error"] = error[:1000]
+    fields["failed_at"] = datetime.now().isoformat()
+    await redis_client.xadd(DEAD_LETTER_STREAM, fields, maxlen=10000, approximate=True)
+    await ack_job(message_id)
@@ -0,0 +1,158 @@
+# Long-document reduction for analysis: split into chunks, condense them concurrently
+# (extractive scorer or a cheap LLM) and join the results within a token budget.
+import asyncio
+import hashlib
+import os
+import re
+from collections import Counter
+from typing import List
+
+from app.redis_client import redis_client
+
+# Constants
+ANALYSIS_TOKEN_BUDGET = int(os.getenv("ANALYSIS_TOKEN_BUDGET", "4000"))  # news text tokens sent to the analyzer
+CONDENSE_CHUNK_TOKENS = int(os.getenv("CONDENSE_CHUNK_TOKENS", "1500"))
+CONDENSE_MODE = os.getenv("CONDENSE_MODE", "extractive")  # extractive | llm
+CONDENSE_PROVIDER = os.getenv("CONDENSE_PROVIDER", "deepseek")  # cheap model for CONDENSE_MODE=llm
+CONDENSE_CONCURRENCY = int(os.getenv("CONDENSE_CONCURRENCY", "4"))
+CONDENSE_CACHE_TTL = int(os.getenv("CONDENSE_CACHE_TTL", "86400"))
+CHARS_PER_TOKEN = 3  # rough average for mixed Russian/English text
+
+SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+|\n+")
+WORD_RE = re.compile(r"\w{4,}")
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN
+
+def split_chunks(text: str, chunk_tokens: int = CONDENSE_CHUNK_TOKENS) -> List[str]:
+    """Splits on line boundaries into chunks of about chunk_tokens; very long lines are cut."""
+    max_chars = chunk_tokens * CHARS_PER_TOKEN
+    chunks, current, size = [], [], 0
+    for line in text.splitlines():
+        while len(line) > max_chars:
+            chunks.append(line[:max_chars])
+            line = line[max_chars:]
+        if size + len(line) > max_chars and current:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return [chunk for chunk in chunks if chunk.strip()]
+
+def truncate_head(text: str, max_chars: int) -> str:
+    """First max_chars of text, cut back to a word boundary when there is one."""
+    text = text.strip()
+    if len(text) <= max_chars:
+        return text
+    head = text[:max_chars]
+    cut = head.rfind(" ")
+    return head[:cut] if cut > max_chars // 2 else head
+
+def extractive_condense(text: str, max_chars: int) -> str:
+    """
+    Keeps the highest-scoring sentences (in original order) within max_chars.
+    Score: average frequency of the sentence's content words, with bonuses for
+    numbers and quotes (facts) and for the opening sentences.
+    If no sentence fits (e.g. text without punctuation), keeps the head of the text instead.
+    """
+    sentences = [s.strip() for s in SENTENCE_RE.split(text) if s and s.strip()]
+    if not sentences:
+        return ""
+    frequencies = Counter(WORD_RE.findall(text.lower()))
+    top = max(frequencies.values(), default=1)
+
+    scored = []
+    for index, sentence in enumerate(sentences):
+        words = WORD_RE.findall(sentence.lower())
+        score = sum(frequencies[word] / top for word in words) / (len(words) + 1)
+        if re.search(r"\d", sentence):
+            score += 0.2
+        if any(mark in sentence for mark in ('"', "«", "“")):
+            score += 0.2
+        if index < 2:
+            score += 0.3
+        scored.append((score, index))
+
+    selected, size = [], 0
+    for score, index in sorted(scored, reverse=True):
+        length = len(sentences[index]) + 1
+        if size + length > max_chars:
+            continue
+        selected.append(index)
+        size += length
+    if not selected:
+        return truncate_head(text, max_chars)
+    return " ".join(sentences[index] for index in sorted(selected))
+
+async def llm_condense(text: str, max_chars: int) -> str:
+    from langchain_core.messages import HumanMessage
+    from app.llm_factory import get_llm
+
+    llm = get_llm(CONDENSE_PROVIDER, temperature=0)
+    prompt = f"""
+    Condense this fragment of a news article to at most {max(1, max_chars // 7)} words.
+    Keep all facts, numbers, names, dates and direct quotes. Drop boilerplate, ads and navigation.
+    Answer in the language of the fragment, with no preamble.
+
+    Fragment:
+    {text}
+    """
+    response = await llm.ainvoke([HumanMessage(content=prompt)])
+    return response.content.strip()[:max_chars]
+
+def _chunk_cache_key(chunk: str, max_chars: int) -> str:
+    digest = hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+    engine = f"llm:{CONDENSE_PROVIDER}" if CONDENSE_MODE == "llm" else "extractive"
+    return f"condense:{engine}:{max_chars}:{digest}"
+
+async def condense_chunk(chunk: str, max_chars: int) -> str:
+    """Condenses one chunk, cached by its content and budget."""
+    if len(chunk) <= max_chars:
+        return chunk
+
+    key = _chunk_cache_key(chunk, max_chars)
+    try:
+        cached = await redis_client.get(key)
+        if cached:
+            return cached
+    except Exception as e:
+        print(f"Condense Cache Read Error: {e}")
+
+    if CONDENSE_MODE == "llm":
+        try:
+            condensed = await llm_condense(chunk, max_chars) or extractive_condense(chunk, max_chars)
+        except Exception as e:
+            print(f"Condense LLM Error, using extractive: {e}")
+            condensed = extractive_condense(chunk, max_chars)
+    else:
+        condensed = extractive_condense(chunk, max_chars)
+
+    try:
+        await redis_client.setex(key, CONDENSE_CACHE_TTL, condensed)
+    except Exception as e:
+        print(f"Condense Cache Write Error: {e}")
+    return condensed
+
+async def condense_text(text: str, token_budget: int = ANALYSIS_TOKEN_BUDGET) -> str:
+    """
+    Returns text unchanged if it fits the budget. Otherwise every chunk gets a share
+    of the budget proportional to its length, and all chunks are condensed concurrently.
+    """
+    budget_chars = token_budget * CHARS_PER_TOKEN
+    if len(text) <= budget_chars:
+        return text
+
+    chunks = split_chunks(text)
+    total = sum(len(chunk) for chunk in chunks) or 1
+    semaphore = asyncio.Semaphore(CONDENSE_CONCURRENCY)
+
+    async def condense(chunk: str) -> str:
+        async with semaphore:
+            return await condense_chunk(chunk, max(200, budget_chars * len(chunk) // total))
+
+    condensed = await asyncio.gather(*(condense(chunk) for chunk in chunks))
+    result = "\n\n".join(part for part in condensed if part) or truncate_head(text, budget_chars)
+    print(f"Condensed {len(text)} -> {len(result)} chars ({len(chunks)} chunks, {CONDENSE_MODE})")
+    return result[:budget_chars]
@@ -0,0 +1,211 @@
+import asyncio
+import os
+import random
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from app.redis_client import redis_client
+
+# Shared scraper HTTP client: keep-alive pool, optional HTTP/2, per-host politeness
+SCRAPE_TIMEOUT = float(os.getenv("SCRAPE_TIMEOUT", "10"))
+SCRAPE_HTTP2 = os.getenv("SCRAPE_HTTP2", "false").lower() in ("1", "true", "yes")  # needs: pip install h2
+SCRAPE_MAX_CONNECTIONS = int(os.getenv("SCRAPE_MAX_CONNECTIONS", "50"))
+SCRAPE_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("SCRAPE_MAX_KEEPALIVE_CONNECTIONS", "20"))
+SCRAPE_HOST_CONCURRENCY = int(os.getenv("SCRAPE_HOST_CONCURRENCY", "2"))  # parallel requests per host
+SCRAPE_HOST_MIN_DELAY = float(os.getenv("SCRAPE_HOST_MIN_DELAY", "0.5"))  # seconds between requests to a host
+SCRAPE_MAX_RETRIES = int(os.getenv("SCRAPE_MAX_RETRIES", "2"))
+SCRAPE_RETRY_BASE_DELAY = float(os.getenv("SCRAPE_RETRY_BASE_DELAY", "1"))
+SCRAPE_RETRY_MAX_DELAY = 30.0
+SCRAPE_MAX_THROTTLES = int(os.getenv("SCRAPE_MAX_THROTTLES", "1024"))  # hosts with in-process throttle state
+SCRAPE_STATS_TTL = int(os.getenv("SCRAPE_STATS_TTL", str(7 * 86400)))  # per-host stats of hosts not scraped since expire
+SCRAPE_STATS_MAX_HOSTS = int(os.getenv("SCRAPE_STATS_MAX_HOSTS", "1000"))  # busiest hosts kept in the index
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+HOSTS_INDEX_KEY = "scrape_hosts"  # ZSET: host -> request count (capped at SCRAPE_STATS_MAX_HOSTS)
+
+def get_host_stats_key(host: str) -> str:
+    return f"scrape_host:{host}"  # HASH: requests / errors / retries / total_ms / last_ms
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+class HostThrottle:
+    """Concurrency limit and minimum spacing between request starts for one host (per process)."""
+
+    def __init__(self):
+        self.semaphore = asyncio.Semaphore(SCRAPE_HOST_CONCURRENCY)
+        self.lock = asyncio.Lock()
+        self.next_start = 0.0
+        self.users = 0  # requests holding or waiting for this throttle
+
+    def idle(self) -> bool:
+        return self.users == 0 and time.monotonic() >= self.next_start
+
+    async def wait_turn(self):
+        async with self.lock:
+            delay = self.next_start - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.next_start = time.monotonic() + SCRAPE_HOST_MIN_DELAY
+
+_client: Optional[httpx.AsyncClient] = None
+_throttles: "OrderedDict[str, HostThrottle]" = OrderedDict()  # LRU, capped at SCRAPE_MAX_THROTTLES
+
+def get_scrape_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        if SCRAPE_HTTP2 and not HTTP2_AVAILABLE:
+            print("SCRAPE_HTTP2 is set but the h2 package is not installed; using HTTP/1.1")
+        _client = httpx.AsyncClient(
+            follow_redirects=True,
+            timeout=SCRAPE_TIMEOUT,
+            http2=SCRAPE_HTTP2 and HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=SCRAPE_MAX_CONNECTIONS,
+                max_keepalive_connections=SCRAPE_MAX_KEEPALIVE_CONNECTIONS,
+            ),
+        )
+    return _client
+
+def _throttle(host: str) -> HostThrottle:
+    throttle = _throttles.get(host)
+    if throttle is not None:
+        _throttles.move_to_end(host)
+        return throttle
+
+    throttle = _throttles[host] = HostThrottle()
+    if len(_throttles) > SCRAPE_MAX_THROTTLES:
+        # Evict the least recently used idle host; busy ones keep their limits
+        for old_host, old in _throttles.items():
+            if old_host != host and old.idle():
+                del _throttles[old_host]
+                break
+    return throttle
+
+def _backoff(attempt: int) -> float:
+    """Exponential backoff with jitter."""
+    delay = min(SCRAPE_RETRY_BASE_DELAY * (2 ** attempt), SCRAPE_RETRY_MAX_DELAY)
+    return delay * random.uniform(0.8, 1.2)
+
+def _retry_after(response: httpx.Response, attempt: int) -> float:
+    """Retry-After (seconds or HTTP date) if the server sent one, else backoff."""
+    value = response.headers.get("Retry-After")
+    if value:
+        try:
+            delay = float(value)
+        except ValueError:
+            try:
+                delay = parsedate_to_datetime(value).timestamp() - time.time()
+            except (TypeError, ValueError):
+                delay = 0
+        if delay > 0:
+            return min(delay, SCRAPE_RETRY_MAX_DELAY)
+    return _backoff(attempt)
+
+async def _record(host: str, elapsed_ms: float, error: bool, retries: int):
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            key = get_host_stats_key(host)
+            pipe.hincrby(key, "requests", 1)
+            pipe.hincrbyfloat(key, "total_ms", round(elapsed_ms, 1))
+            if error:
+                pipe.hincrby(key, "errors", 1)
+            if retries:
+                pipe.hincrby(key, "retries", retries)
+            pipe.hset(key, "last_ms", round(elapsed_ms, 1))
+            pipe.expire(key, SCRAPE_STATS_TTL)
+            pipe.zincrby(HOSTS_INDEX_KEY, 1, host)
+            # Keep only the busiest hosts in the index
+            pipe.zremrangebyrank(HOSTS_INDEX_KEY, 0, -(SCRAPE_STATS_MAX_HOSTS + 1))
+            pipe.expire(HOSTS_INDEX_KEY, SCRAPE_STATS_TTL)
+            await pipe.execute()
+    except Exception as e:
+        print(f"Scrape Stats Error: {e}")
+
+@asynccontextmanager
+async def scrape_stream(url: str, headers: Optional[dict] = None):
+    """
+    Streams a GET through the shared client. The host slot is held until the body is read.
+    429/5xx and connection errors are retried with backoff (Retry-After is honoured).
+    """
+    host = urlsplit(url).hostname or ""
+    throttle = _throttle(host)
+    client = get_scrape_client()
+
+    throttle.users += 1  # keeps the throttle from being evicted while in use
+    try:
+        async with throttle.semaphore:
+            start = time.monotonic()
+            response = None
+            attempt = 0
+            error = True
+            try:
+                while True:
+                    await throttle.wait_turn()
+                    try:
+                        response = await client.send(client.build_request("GET", url, headers=headers), stream=True)
+                    except httpx.TransportError:
+                        if attempt >= SCRAPE_MAX_RETRIES:
+                            raise
+                        await asyncio.sleep(_backoff(attempt))
+                        attempt += 1
+                        continue
+
+                    if response.status_code in RETRY_STATUSES and attempt < SCRAPE_MAX_RETRIES:
+                        delay = _retry_after(response, attempt)
+                        await response.aclose()
+                        await asyncio.sleep(delay)
+                        attempt += 1
+                        continue
+                    break
+
+                yield response
+                error = response.status_code >= 400
+            finally:
+                if response is not None:
+                    await response.aclose()
+                await _record(host, (time.monotonic() - start) * 1000, error, attempt)
+    finally:
+        throttle.users -= 1
+
+async def get_scrape_host_stats(limit: int = 20) -> list:
+    """Busiest hosts with request/error/retry counts and latency."""
+    try:
+        hosts = await redis_client.zrevrange(HOSTS_INDEX_KEY, 0, limit - 1)
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for host in hosts:
+                pipe.hgetall(get_host_stats_key(host))
+            results = await pipe.execute()
+    except Exception as e:
+        print(f"Scrape Stats Error: {e}")
+        return []
+
+    stats = []
+    for host, data in zip(hosts, results):
+        if not data:
+            continue  # stats expired, index entry not yet trimmed
+        requests = int(data.get("requests", 0))
+        stats.append({
+            "host": host,
+            "requests": requests,
+            "errors": int(data.get("errors", 0)),
+            "retries": int(data.get("retries", 0)),
+            "avg_ms": round(float(data.get("total_ms", 0)) / requests, 1) if requests else 0.0,
+            "last_ms": float(data.get("last_ms", 0)),
+        })
+    return stats
+
+async def close_scrape_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
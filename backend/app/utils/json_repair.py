@@ -0,0 +1,98 @@
+import json
+
+def _close(text: str, stack: list) -> str:
+    """Closes all open containers."""
+    text = text.rstrip()
+    while text and text[-1] in ",:":
+        text = text[:-1].rstrip()
+    return text + "".join("}" if opener == "{" else "]" for opener in reversed(stack))
+
+def scan_json_object(raw: str) -> tuple:
+    """
+    Single pass over the first JSON object in raw: escapes raw newlines inside strings,
+    drops trailing commas, stops at the matching brace (chatter after it is ignored).
+    Returns (text, stack, safe_points); stack is non-empty if the output was truncated.
+    safe_points are lengths of text that end right after a complete value outside any array
+    (a truncated list is dropped as a whole rather than kept shortened).
+    """
+    # Code fences and prose around the object need no stripping: the scan starts at the first "{"
+    # and stops at its matching brace, and "```" inside string values is left alone
+    start = raw.find("{")
+    if start == -1:
+        raise ValueError("No JSON object found")
+
+    out = []
+    stack = []
+    in_string = escape = is_key = False
+    last = ""  # last structural character outside strings
+    safe_points = []
+    for char in raw[start:]:
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+                out.append(char)
+                if not is_key and "[" not in stack:
+                    safe_points.append(len(out))
+                continue
+            elif char == "\n":
+                char = "\\n"
+            elif char in "\r\t":
+                char = "\\r" if char == "\r" else "\\t"
+            out.extend(char)  # one entry per character keeps safe_points aligned with text
+            continue
+
+        if char == '"':
+            in_string = True
+            # In an object, a string right after "{" or "," is a key, not a value
+            is_key = bool(stack) and stack[-1] == "{" and last in "{,"
+        elif char in "{[":
+            stack.append(char)
+        elif char in "}]":
+            # Trailing comma before a closing bracket
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            if stack:
+                stack.pop()
+            out.append(char)
+            last = char
+            if not stack:
+                break
+            if "[" not in stack:
+                safe_points.append(len(out))
+            continue
+        elif char == ",":
+            # Whatever preceded the comma (numbers, literals included) is complete
+            if last not in "{[," and "[" not in stack:
+                safe_points.append(len(out))
+        if not char.isspace():
+            last = char if char in '{[,:' else (last if char == '"' else "v")
+        out.append(char)
+
+    return "".join(out), stack, safe_points
+
+def parse_json_tolerant(raw: str) -> dict:
+    """
+    Parses the first JSON object in an LLM response, tolerating code fences, text around it,
+    trailing commas and raw newlines in strings. Truncated output keeps only complete members:
+    a value cut off mid-string, mid-number or mid-list is dropped, so callers see it as missing.
+    """
+    text, stack, safe_points = scan_json_object(raw)
+    if stack:
+        cut = safe_points[-1] if safe_points else 1  # nothing complete: "{"
+        prefix, prefix_stack, _ = scan_json_object(text[:cut])
+        text = _close(prefix, prefix_stack)
+
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Unrecoverable JSON: {e}")
+
+    if not isinstance(data, dict):
+        raise ValueError("Expected a JSON object")
+    return data
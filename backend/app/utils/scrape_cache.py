@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import time
+from typing import Optional
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from app.redis_client import redis_client
+
+# Constants
+SCRAPE_FRESHNESS_TTL = int(os.getenv("SCRAPE_FRESHNESS_TTL", "3600"))  # served without revalidation
+SCRAPE_CACHE_TTL = int(os.getenv("SCRAPE_CACHE_TTL", str(7 * 86400)))  # kept for conditional GETs
+
+STATS_KEY = "scrape_cache:stats"  # HASH: hits / revalidated / misses
+
+TRACKING_PARAMS = {"fbclid", "gclid", "yclid", "mc_cid", "mc_eid", "_openstat", "from", "ref"}
+
+def canonicalize_url(url: str) -> str:
+    """Normalizes a URL so trivial variants (tracking params, fragments, case) share one entry."""
+    parts = urlsplit(url.strip())
+    scheme = (parts.scheme or "http").lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and not ((scheme == "http" and parts.port == 80) or (scheme == "https" and parts.port == 443)):
+        host = f"{host}:{parts.port}"
+
+    path = parts.path or "/"
+    if len(path) > 1 and path.endswith("/"):
+        path = path.rstrip("/")
+
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS
+    )
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
+
+def get_cache_key(canonical_url: str) -> str:
+    return f"scrape_cache:{hashlib.sha256(canonical_url.encode('utf-8')).hexdigest()}"
+
+def is_fresh(entry: dict) -> bool:
+    return time.time() - entry.get("fetched_at", 0) < SCRAPE_FRESHNESS_TTL
+
+async def _count(field: str):
+    try:
+        await redis_client.hincrby(STATS_KEY, field, 1)
+    except Exception:
+        pass
+
+async def get_cached_page(canonical_url: str) -> Optional[dict]:
+    """Returns {"text", "etag", "last_modified", "fetched_at"} or None."""
+    try:
+        raw = await redis_client.get(get_cache_key(canonical_url))
+        return json.loads(raw) if raw else None
+    except Exception as e:
+        print(f"Scrape Cache Read Error: {e}")
+        return None
+
+async def cache_page(canonical_url: str, text: str, etag: Optional[str] = None, last_modified: Optional[str] = None):
+    """Stores extracted text together with the validators for the next conditional GET."""
+    entry = {
+        "url": canonical_url,
+        "text": text,
+        "etag": etag,
+        "last_modified": last_modified,
+        "fetched_at": time.time(),
+    }
+    try:
+        await redis_client.setex(get_cache_key(canonical_url), SCRAPE_CACHE_TTL, json.dumps(entry, ensure_ascii=False))
+    except Exception as e:
+        print(f"Scrape Cache Write Error: {e}")
+
+async def touch_cached_page(canonical_url: str, entry: dict):
+    """Marks an entry fresh again after a 304 Not Modified."""
+    await cache_page(canonical_url, entry["text"], entry.get("etag"), entry.get("last_modified"))
+
+async def record_hit():
+    await _count("hits")
+
+async def record_revalidated():
+    await _count("revalidated")
+
+async def record_miss():
+    await _count("misses")
+
+async def get_scrape_cache_stats() -> dict:
+    try:
+        stats = await redis_client.hgetall(STATS_KEY)
+    except Exception as e:
+        print(f"Scrape Cache Stats Error: {e}")
+        return {}
+    return {
+        "hits": int(stats.get("hits", 0)),
+        "revalidated": int(stats.get("revalidated", 0)),
+        "misses": int(stats.get("misses", 0)),
+        "freshness_ttl": SCRAPE_FRESHNESS_TTL,
+    }
@@ -1,42 +1,163 @@
 import httpx
+import os
+import re
 from bs4 import BeautifulSoup
 import logging
+from typing import Iterable
+from app.utils.scrape_cache import (
+    canonicalize_url, get_cached_page, cache_page, touch_cached_page, is_fresh,
+    record_hit, record_revalidated, record_miss
+)
+from app.utils.http_client import scrape_stream
+
+# C-backed parsers (optional): selectolax (lexbor) > lxml > BeautifulSoup html.parser
+try:
+    from selectolax.lexbor import LexborHTMLParser  # pip install selectolax
+except ImportError:
+    LexborHTMLParser = None
+
+try:
+    import lxml.html  # pip install lxml
+except ImportError:
+    lxml = None
 
 logger = logging.getLogger(__name__)
 
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.5",
+}
+
+SCRAPE_MAX_BYTES = int(os.getenv("SCRAPE_MAX_BYTES", str(2 * 1024 * 1024)))  # body is cut off after this
+SCRAPE_MAX_CHARS = int(os.getenv("SCRAPE_MAX_CHARS", "60000"))  # long articles are condensed before analysis
+
+SKIP_TAGS = ["script", "style", "nav", "footer", "header"]
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml", "application/xml", "text/xml")
+META_CHARSET_RE = re.compile(rb"""<meta[^>]+charset=["']?([\w-]+)""", re.IGNORECASE)
+
+def _collect_text(pieces: Iterable[str], max_chars: int) -> str:
+    """
+    Joins text nodes one per line, strips each line, splits multi-headlines on double spaces
+    and drops blank lines. Stops as soon as max_chars are collected.
+    """
+    chunks = []
+    size = 0
+    for piece in pieces:
+        for line in piece.splitlines():
+            for phrase in line.strip().split("  "):
+                phrase = phrase.strip()
+                if not phrase:
+                    continue
+                chunks.append(phrase)
+                size += len(phrase) + 1
+                if size >= max_chars:
+                    return "\n".join(chunks)[:max_chars]
+    return "\n".join(chunks)[:max_chars]
+
+def _texts_selectolax(html: str):
+    tree = LexborHTMLParser(html)
+    tree.strip_tags(SKIP_TAGS)
+    for node in tree.root.traverse(include_text=True):
+        if node.tag == "-text":
+            yield node.text(deep=False)
+
+def _texts_lxml(html: str):
+    root = lxml.html.fromstring(html.encode("utf-8"), parser=lxml.html.HTMLParser(encoding="utf-8"))
+    for element in list(root.iter(*SKIP_TAGS)):
+        element.drop_tree()
+    return root.itertext()
+
+def _texts_bs4(html: str):
+    soup = BeautifulSoup(html, 'html.parser')
+
+    # Remove script and style elements
+    for script in soup(SKIP_TAGS):
+        script.decompose()
+
+    return [soup.get_text(separator='\n')]
+
+def extract_text(html: str, max_chars: int = SCRAPE_MAX_CHARS) -> str:
+    """Extracts readable text from an HTML page (fastest available parser)."""
+    if not html.strip():
+        return ""
+    if LexborHTMLParser is not None:
+        texts = _texts_selectolax(html)
+    elif lxml is not None:
+        texts = _texts_lxml(html)
+    else:
+        texts = _texts_bs4(html)
+    return _collect_text(texts, max_chars)
+
+def decode_body(raw: bytes, charset: str | None) -> str:
+    """Decodes a (possibly truncated) body: header charset, then <meta charset>, then UTF-8."""
+    if not charset:
+        match = META_CHARSET_RE.search(raw[:4096])
+        charset = match.group(1).decode("ascii") if match else "utf-8"
+    try:
+        return raw.decode(charset, errors="replace")
+    except LookupError:
+        return raw.decode("utf-8", errors="replace")
+
+async def read_capped(response: httpx.Response, max_bytes: int = SCRAPE_MAX_BYTES) -> bytes:
+    """Reads a streamed body up to max_bytes, then stops downloading."""
+    buffer = bytearray()
+    async for chunk in response.aiter_bytes():
+        buffer.extend(chunk)
+        if len(buffer) >= max_bytes:
+            break
+    return bytes(buffer[:max_bytes])
+
 async def scrape_url(url: str) -> str:
     """
     Fetches the content of a URL and extracts the text.
+    Results are cached per canonical URL and revalidated with conditional GETs.
     """
     try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-            "Accept-Language": "en-US,en;q=0.5",
-        }
-        async with httpx.AsyncClient(follow_redirects=True, timeout=10.0, headers=headers) as client:
-            response = await client.get(url)
+        canonical_url = canonicalize_url(url)
+        cached = await get_cached_page(canonical_url)
+
+        if cached and is_fresh(cached):
+            await record_hit()
+            return cached["text"]
+
+        headers = dict(HEADERS)
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        # Shared pooled client with per-host limits and retries (app/utils/http_client.py)
+        async with scrape_stream(url, headers=headers) as response:
+            if response.status_code == 304 and cached:
+                await touch_cached_page(canonical_url, cached)
+                await record_revalidated()
+                return cached["text"]
+
             response.raise_for_status()
-            
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Remove script and style elements
-        for script in soup(["script", "style", "nav", "footer", "header"]):
-            script.decompose()
-            
-        # Get text
-        text = soup.get_text(separator='\n')
-        
-        # Break into lines and remove leading/trailing space on each
-        lines = (line.strip() for line in text.splitlines())
-        # Break multi-headlines into a line each
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-        # Drop blank lines
-        text = '\n'.join(chunk for chunk in chunks if chunk)
-        
-        # Limit length to avoid token limits
-        return text[:15000]
-        
+
+            # Don't download PDFs, images, video etc.
+            content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+            if content_type and content_type != "text/plain" and content_type not in HTML_CONTENT_TYPES:
+                raise ValueError(f"Unsupported content type: {content_type}")
+
+            body = decode_body(await read_capped(response), response.charset_encoding)
+
+        if content_type == "text/plain":
+            text = _collect_text([body], SCRAPE_MAX_CHARS)
+        else:
+            text = extract_text(body)
+
+        await record_miss()
+        await cache_page(
+            canonical_url,
+            text,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified")
+        )
+        return text
+
     except Exception as e:
         logger.error(f"Error scraping {url}: {e}")
         return f"Error scraping content: {str(e)}"
@@ -0,0 +1,53 @@
+class SeparatorStream:
+    """
+    Splits streamed LLM text at the first occurrence of `separator`.
+    feed() returns only text that is certainly before the separator: a possible
+    partial separator at the end of a chunk is held back until the next chunk.
+    """
+
+    def __init__(self, separator: str = "|||"):
+        self.separator = separator
+        self.content = ""  # everything emitted before the separator
+        self.tail = ""  # everything after it
+        self.found = False
+        self._pending = ""
+
+    def feed(self, chunk: str) -> str:
+        if self.found:
+            self.tail += chunk
+            return ""
+
+        buffer = self._pending + chunk
+        index = buffer.find(self.separator)
+        if index != -1:
+            emit = buffer[:index]
+            self.tail = buffer[index + len(self.separator):]
+            self._pending = ""
+            self.found = True
+        else:
+            keep = 0
+            for size in range(min(len(self.separator) - 1, len(buffer)), 0, -1):
+                if self.separator.startswith(buffer[-size:]):
+                    keep = size
+                    break
+            emit = buffer[:len(buffer) - keep]
+            self._pending = buffer[len(buffer) - keep:]
+
+        self.content += emit
+        return emit
+
+    def flush(self) -> str:
+        """Releases a held-back partial separator once the stream is over."""
+        emit, self._pending = self._pending, ""
+        self.content += emit
+        return emit
+
+def chunk_text(chunk) -> str:
+    """Text of a streamed message chunk (content may be a string or a list of blocks)."""
+    content = chunk.content
+    if isinstance(content, str):
+        return content
+    return "".join(
+        block.get("text", "") if isinstance(block, dict) else str(block)
+        for block in content
+    )
@@ -0,0 +1,169 @@
+# Generation worker: consumes jobs from the Redis Stream filled by /generate and /bot/generate.
+# Run with `python -m app.worker`; scale by starting more processes.
+import asyncio
+import os
+import signal
+import socket
+import time
+
+from app.models import NewsInput
+from app.generation import run_generation_task
+from app.task_queue import (
+    ensure_job_group, read_jobs, claim_stale_jobs, promote_delayed_jobs, heartbeat_job,
+    ack_job, retry_job, dead_letter_job, parse_job, update_task_status, TaskStatus,
+    JOB_MAX_ATTEMPTS, JOB_VISIBILITY_TIMEOUT
+)
+
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "2"))  # jobs per process
+HEARTBEAT_INTERVAL = max(5, JOB_VISIBILITY_TIMEOUT // 3)
+MAINTENANCE_INTERVAL = 1.0  # delayed-job promotion / stale-job recovery
+READ_BLOCK_MS = 2000
+
+async def _heartbeat(consumer: str, message_id):
+    """Keeps a long-running job from being reclaimed by other workers."""
+    while True:
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+        try:
+            await heartbeat_job(consumer, message_id)
+        except Exception as e:
+            print(f"Worker Heartbeat Error: {e}")
+
+async def process_job(consumer: str, message_id, fields: dict):
+    """Runs one job: ack on success, retry with backoff on failure, dead-letter after the last attempt."""
+    try:
+        job = parse_job(fields)
+    except Exception as e:
+        print(f"Worker: dropping malformed job {message_id}: {e}")
+        await ack_job(message_id)
+        return
+
+    final_attempt = job["attempt"] >= JOB_MAX_ATTEMPTS
+    print(f"Worker {consumer}: task {job['task_id']} (attempt {job['attempt']}/{JOB_MAX_ATTEMPTS})")
+
+    heartbeat = asyncio.create_task(_heartbeat(consumer, message_id))
+    try:
+        ok = await run_generation_task(
+            job["task_id"], NewsInput(**job["news"]), job["user_id"], final_attempt=final_attempt
+        )
+        if ok:
+            await ack_job(message_id)
+        else:
+            await dead_letter_job(message_id, job, "Generation failed")
+    except Exception as e:
+        if final_attempt:
+            # Raised outside run_generation_task's own final-attempt handling (bad payload, Redis error)
+            print(f"Worker: task {job['task_id']} failed on final attempt: {e}")
+            try:
+                await update_task_status(job["task_id"], TaskStatus.ERROR, error=str(e))
+            except Exception as status_error:
+                print(f"Worker Status Error: {status_error}")
+            await dead_letter_job(message_id, job, str(e))
+        else:
+            print(f"Worker: task {job['task_id']} failed, retrying: {e}")
+            await retry_job(message_id, job)
+    finally:
+        heartbeat.cancel()
+        if job.get("batch_id"):
+            await _refill_batch(job)
+
+async def _refill_batch(job: dict):
+    """A batch job finished: release the next queued items of the user's batches."""
+    from app.batches import refill_user_batches
+    try:
+        await refill_user_batches(job["user_id"], job["batch_id"], job["task_id"])
+    except Exception as e:
+        print(f"Worker Batch Refill Error: {e}")
+
+async def recover_stale_jobs(consumer: str):
+    """Re-queues jobs claimed by a worker that died without acknowledging them."""
+    for message_id, fields in await claim_stale_jobs(consumer):
+        job = parse_job(fields)
+        print(f"Worker: recovering stale task {job['task_id']} (attempt {job['attempt']})")
+        if job["attempt"] >= JOB_MAX_ATTEMPTS:
+            await update_task_status(job["task_id"], TaskStatus.ERROR, error="Worker crashed while processing the task")
+            await dead_letter_job(message_id, job, "Visibility timeout exceeded on final attempt")
+            if job.get("batch_id"):
+                await _refill_batch(job)
+        else:
+            await retry_job(message_id, job)
+
+async def maintenance_loop(consumer: str, stop: asyncio.Event):
+    from app.rag.store import rag_store, RAG_INGEST_FLUSH_INTERVAL
+
+    last_ingest = 0.0
+    while not stop.is_set():
+        try:
+            await promote_delayed_jobs()
+            await recover_stale_jobs(consumer)
+            # Liked cases left queued by a failed flush or an API restart
+            if time.monotonic() - last_ingest >= RAG_INGEST_FLUSH_INTERVAL:
+                last_ingest = time.monotonic()
+                await rag_store.flush()
+        except Exception as e:
+            print(f"Worker Maintenance Error: {e}")
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=MAINTENANCE_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+async def run_worker():
+    consumer = f"{socket.gethostname()}-{os.getpid()}"
+    await ensure_job_group()
+
+    # The worker may start before the API; make sure tables it writes to exist
+    from app.database import engine, Base
+    from app.history_index import PlanIndexEntry
+    await asyncio.to_thread(Base.metadata.create_all, bind=engine)
+    print(f"Worker {consumer} started (concurrency={WORKER_CONCURRENCY})")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+
+    maintenance = asyncio.create_task(maintenance_loop(consumer, stop))
+
+    from app.monitor import MONITOR_ENABLED, monitoring_loop
+    monitor = asyncio.create_task(monitoring_loop(stop)) if MONITOR_ENABLED else None
+    slots = asyncio.Semaphore(WORKER_CONCURRENCY)
+    running = set()
+
+    while not stop.is_set():
+        await slots.acquire()
+        try:
+            jobs = await read_jobs(consumer, 1, READ_BLOCK_MS)
+        except Exception as e:
+            print(f"Worker Read Error: {e}")
+            jobs = []
+            await asyncio.sleep(1)
+
+        if not jobs:
+            slots.release()
+            continue
+
+        for message_id, fields in jobs:
+            task = asyncio.create_task(process_job(consumer, message_id, fields))
+            running.add(task)
+            task.add_done_callback(running.discard)
+            task.add_done_callback(lambda _: slots.release())
+
+    # Graceful shutdown: let in-flight jobs finish; anything cut off is reclaimed by another worker
+    print(f"Worker {consumer} stopping, waiting for {len(running)} job(s)")
+    if running:
+        await asyncio.wait(running, timeout=JOB_VISIBILITY_TIMEOUT)
+    maintenance.cancel()
+    if monitor:
+        monitor.cancel()
+
+    from app.llm_factory import close_llm_clients
+    from app.redis_client import close_redis
+    from app.utils.http_client import close_scrape_client
+    await close_llm_clients()
+    await close_scrape_client()
+    await close_redis()
+
+if __name__ == "__main__":
+    asyncio.run(run_worker())
@@ -0,0 +1,75 @@
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# Synthetic "summaries" built from a small vocabulary, so both backends embed the same texts
+WORDS = (
+    "бренд запуск продукт кризис рынок конкурент акции инвестиции регулятор отчет выручка "
+    "сотрудники офис приложение обновление сбой клиенты партнеры сделка суд штраф рост падение "
+    "экспорт импорт банк ставка технология платформа сервис доставка ритейл цены"
+).split()
+
+def make_text(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(12, 30)))
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+def bench(name, backend, cases, queries, user_id, n_results):
+    start = time.perf_counter()
+    for i in range(0, len(cases), 64):
+        backend.add_cases(cases[i:i + 64])
+    ingest = time.perf_counter() - start
+
+    # Warm-up (lazy shard load / model load)
+    backend.query(queries[0], user_id=user_id, n_results=n_results)
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        backend.query(query, user_id=user_id, n_results=n_results)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    print(
+        f"{name:>7}: ingest {len(cases)} cases in {ingest:.2f}s | "
+        f"query p50 {statistics.median(latencies):.1f}ms, p95 {percentile(latencies, 0.95):.1f}ms, "
+        f"max {max(latencies):.1f}ms"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare ChromaDB and the in-process RAG backend.")
+    parser.add_argument("--cases", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--n-results", type=int, default=3)
+    parser.add_argument("--user-id", type=int, default=999999)
+    parser.add_argument("--skip-chroma", action="store_true", help="Only benchmark the local backend")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    cases = [
+        {"doc_id": f"bench-{i}", "text": make_text(rng), "metadata": {"user_id": args.user_id, "plan_id": f"bench-{i}"}}
+        for i in range(args.cases)
+    ]
+    queries = [make_text(rng) for _ in range(args.queries)]
+
+    from app.rag.local_index import LocalVectorBackend
+    with tempfile.TemporaryDirectory() as tmp:
+        bench("local", LocalVectorBackend(base_dir=tmp), cases, queries, args.user_id, args.n_results)
+
+    if not args.skip_chroma:
+        from app.rag.chroma_backend import ChromaBackend
+        chroma = ChromaBackend(collection_name="bench_brand_context")
+        try:
+            bench("chroma", chroma, cases, queries, args.user_id, args.n_results)
+        finally:
+            chroma.client.delete_collection("bench_brand_context")
+
+if __name__ == "__main__":
+    main()
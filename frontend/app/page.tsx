@@ -153,10 +153,49 @@ export default function Home() {
     }
   };
 
-  // Polling function for task status
+  // Task progress: server-sent events, falls back to polling if the stream fails
   const pollTaskStatus = async (taskId: string) => {
-    const { api } = await import("@/lib/api");
-    const poll = async () => {
+    const { api, API_URL } = await import("@/lib/api");
+    const token = typeof window !== "undefined" ? localStorage.getItem("token") : null;
+
+    if (typeof EventSource !== "undefined" && token) {
+      const source = new EventSource(`${API_URL}/task/${taskId}/events?token=${encodeURIComponent(token)}`);
+
+      source.addEventListener("processing", () => {
+        setRecentPlans(prev => prev.map(p =>
+          p.id === taskId ? { ...p, status: "processing" } : p
+        ));
+      });
+      source.addEventListener("ready", (e: MessageEvent) => {
+        const event = JSON.parse(e.data);
+        source.close();
+        if (event.plan) {
+          setRecentPlans(prev => prev.map(p =>
+            p.id === taskId ? { ...p, ...event.plan, status: "ready" } : p
+          ));
+        } else {
+          poll();
+        }
+      });
+      source.addEventListener("error", (e: Event) => {
+        source.close();
+        // Server-sent "error" event carries data; a transport error doesn't
+        const data = (e as MessageEvent).data;
+        if (data) {
+          const event = JSON.parse(data);
+          setRecentPlans(prev => prev.map(p =>
+            p.id === taskId ? { ...p, status: "error", error: event.error } : p
+          ));
+        } else {
+          poll();
+        }
+      });
+      return;
+    }
+
+    poll();
+
+    async function poll() {
       try {
         const res = await api.get(`/task/${taskId}/status`);
         const task = res.data;
@@ -178,8 +217,7 @@ export default function Home() {
       } catch (e) {
         console.error("Polling error:", e);
       }
-    };
-    poll();
+    }
   };
 
   const handleSelectNews = async (newsItem: any) => {